@@ -1,15 +1,16 @@
 import re, shlex, subprocess, requests
-from typing import Any
+from typing import Any, Optional
 
-from . import metadata, config
+from . import metadata, config, sources, watchdog
 
 AUTH_PATT = re.compile(r'[-\w\s]+?:[^@:]+?@')
 
 # Calling this from the HTTPHandler causes a deadlock, if the server is single-threaded!
-def icecast_status_j(conf: config.Config) -> dict[str, Any]:
+def icecast_status_j(conf: config.Config, target: Optional[dict[str, Any]] = None) -> dict[str, Any]:
+    target = target or conf.icecast["main"]
 
-    url = f"http://{conf.main['icecast_host']}:{conf.main['icecast_port']}/status-json.xsl"
-    auth = ("source", conf.main['icecast_password'])
+    url = f"http://{target['host']}:{target['port']}/status-json.xsl"
+    auth = ("source", target['password'])
     rsp = requests.get(url, auth=auth)
     rsp.raise_for_status()
     
@@ -17,12 +18,14 @@ def icecast_status_j(conf: config.Config) -> dict[str, Any]:
 
 
 # This has more data available, but it needs the admin user und is a tad slower...
-def icecast_status(conf: config.Config) -> dict[str, Any]:
+def icecast_status(conf: config.Config, target: Optional[dict[str, Any]] = None,
+                   timeout: Optional[float] = None) -> dict[str, Any]:
     from xml.etree import ElementTree
+    target = target or conf.icecast["main"]
 
-    url = f"http://{conf.main['icecast_host']}:{conf.main['icecast_port']}/admin/stats"
-    auth = (conf.main['icecast_admin'], conf.main['icecast_admin_password'])
-    rsp = requests.get(url, auth=auth)
+    url = f"http://{target['host']}:{target['port']}/admin/stats"
+    auth = (target['admin'], target['admin_password'])
+    rsp = requests.get(url, auth=auth, timeout=timeout)
     rsp.raise_for_status()
 
     root = ElementTree.fromstring(rsp.content)
@@ -52,9 +55,17 @@ def status(launcher) -> dict[str, dict[str, str | int]]:
     status_dict: dict[str, Any] = {
         "clients": server.mount_clients,
         "processes": { m: {"pid": p.pid, "command": mask(shlex.join(p.args)) } for m, p in server.mount_processes.items() },
+        "inputs": sources.status(),
+        "throughput": watchdog.status(),
+        "linger": server.linger.status(),
+        "sessions": server.sessions.status(),
         "metadata": metadata.api.status(),
-        "icecast": icecast_status(server.conf),
     }
+    status_dict["targets"], total, icecast = server.targets.status()
+    if icecast is not None:
+        status_dict["icecast"] = icecast
+    if total is not None:
+        status_dict["icecast_total"] = total
     return status_dict
 
 def generate_status_json(launcher) -> str:
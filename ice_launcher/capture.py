@@ -0,0 +1,43 @@
+# icelaunch: Capture icecast callback traffic
+#
+# Copyright Jeremy Sanders (2023)
+# Released under the MIT Licence
+
+import json
+import threading
+import time
+
+from . import api
+
+# only these callback parameters are recorded, passwords never are
+CAPTURE_KEYS = ('action', 'mount', 'client', 'server', 'port')
+
+class Capture:
+    '''Append sanitized icecast callbacks to a JSONL file.'''
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.file = open(filename, 'a', encoding='utf-8', buffering=1)
+
+    def record(self, params):
+        '''Record one callback, given its POST parameters.'''
+        event = {'t': round(time.time(), 3)}
+        for key in CAPTURE_KEYS:
+            if key in params:
+                event[key] = api.mask(params[key])
+        line = json.dumps(event, separators=(',', ':'))
+        with self.lock:
+            self.file.write(line + '\n')
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+def read_capture(filename):
+    '''Yield the events of a capture file in order.'''
+    with open(filename, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
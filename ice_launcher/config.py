@@ -48,14 +48,39 @@ main_opts = [
     Option('icecast_admin_password', default='password'),
     Option('icecast_forbid_status', default=False, dtype='bool'),
     Option('legacy_icecast', default=False, dtype='bool'),
+    Option('icecast_group'),
+    Option('icecast_stats_interval', default=10.0, dtype='float'),
+    Option('icecast_stats_timeout', default=2.0, dtype='float'),
+    Option('icecast_source_kbitrate', default=128.0, dtype='float'),
 
     Option('allow_users'),
 
     Option('ffmpeg_wait', default=1.0, dtype='float'),
     Option('ffmpeg_verbose', default=False, dtype='bool'),
     Option('ffmpeg_agent'),
+    Option('ffmpeg_stop_timeout', default=5.0, dtype='float'),
+
+    Option('input_probe', default=True, dtype='bool'),
+    Option('input_probe_timeout', default=5.0, dtype='float'),
+    Option('input_probe_stagger', default=0.25, dtype='float'),
+
+    Option('stall_window', default=20.0, dtype='float'),
+    Option('stall_min_speed', default=0.5, dtype='float'),
 
     Option('source_remove_delay', default=0, dtype='int'),
+    Option('linger_time', dtype='float'),
+    Option('linger_max_warm', dtype='int'),
+    Option('linger_policy', default='lru'),
+
+    Option('capture_file'),
+
+    Option('shutdown_deadline', default=5.0, dtype='float'),
+
+    Option('session_file'),
+    Option('session_capacity', default=65536, dtype='int'),
+    Option('session_bucket', default=3600, dtype='int'),
+    Option('session_retention', default=720, dtype='int'),
+    Option('session_save_interval', default=300.0, dtype='float'),
     
     Option('log_level', default='info'),
     Option('log_debug_metadata', default=False, dtype='bool'),
@@ -63,6 +88,18 @@ main_opts = [
 
 allowed_modes = {'copy_aac', 'copy_mp3'}
 
+# options of icecast servers, and the [main] options used for the main
+# server and as defaults for [icecast.X] sections
+icecast_opts = [
+    ('host', 'icecast_host', 'str'),
+    ('port', 'icecast_port', 'int'),
+    ('user', 'icecast_user', 'str'),
+    ('password', 'icecast_password', 'str'),
+    ('admin', 'icecast_admin', 'str'),
+    ('admin_password', 'icecast_admin_password', 'str'),
+    ('legacy', 'legacy_icecast', 'bool'),
+]
+
 # options in [mount.X] sections
 mount_opts = [
     Option('mode', default='copy_aac'),
@@ -73,8 +110,37 @@ mount_opts = [
     Option('public', default=False),
     Option("meta", default=False, dtype="bool"),
     Option("dynamic", default=False, dtype="bool"),
+    Option("meta_min_interval", default=5.0, dtype="float"),
+    Option("meta_max_interval", default=60.0, dtype="float"),
+    Option("meta_idle_interval", default=300.0, dtype="float"),
+    Option("meta_idle_after", default=6, dtype="int"),
+    Option("meta_max_retry", dtype="int"),
 ]
 
+def parse_inputs(value):
+    '''Split a (multi-line) input option into (input, weight) pairs.
+
+    Each line holds one input, optionally followed by "weight=N" with
+    N a positive number.
+    '''
+    inputs = []
+    for line in value.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        weight = 1.0
+        parts = line.rsplit(None, 1)
+        if len(parts) == 2 and parts[1].startswith('weight='):
+            try:
+                weight = float(parts[1][7:])
+            except ValueError:
+                raise RuntimeError('Invalid input weight: "%s"' % line)
+            if not weight > 0:
+                raise RuntimeError('Invalid input weight: "%s"' % line)
+            line = parts[0]
+        inputs.append((line, weight))
+    return inputs
+
 class Config:
     '''Define set of configuration settings read from conf file.'''
 
@@ -101,6 +167,23 @@ class Config:
                         'User password combination invalid: "%s"' % user_passwd)
                 self.allow_users[s[0]] = s[1]
 
+        # icecast servers to place sources on, the [main] one is called main
+        self.icecast = {'main': {'name': 'main'}}
+        for name, mainname, _dtype in icecast_opts:
+            self.icecast['main'][name] = self.main[mainname]
+        self.icecast['main']['group'] = self.main['icecast_group'] or 'main'
+        for sect in conffile.sections():
+            if sect.startswith('icecast.'):
+                target = sect[8:]
+                if target in self.icecast:
+                    raise RuntimeError('Icecast server "%s" defined twice' % target)
+                self.icecast[target] = {'name': target}
+                for name, mainname, dtype in icecast_opts:
+                    opt = Option(name, default=self.main[mainname], dtype=dtype)
+                    self.icecast[target][name] = opt.get(conffile[sect])
+                self.icecast[target]['group'] = Option(
+                    'group', default=target).get(conffile[sect])
+
         # read sections for each mount (called mount.X)
         self.mounts = {}
         for sect in conffile.sections():
@@ -116,6 +199,13 @@ class Config:
                     raise RuntimeError('Mode "%s" is unknown' % mode)
                 if not self.mounts[mount]['input']:
                     raise RuntimeError('No input given for mount "%s"' % mount)
+                self.mounts[mount]['inputs'] = parse_inputs(self.mounts[mount]['input'])
+                if not self.mounts[mount]['inputs']:
+                    raise RuntimeError('No input given for mount "%s"' % mount)
+                if not 0 < self.mounts[mount]['meta_min_interval'] <= self.mounts[mount]['meta_max_interval']:
+                    raise RuntimeError('Invalid metadata poll interval bounds for mount "%s"' % mount)
+                if self.mounts[mount]['meta_idle_after'] < 1:
+                    raise RuntimeError('meta_idle_after must be at least 1 for mount "%s"' % mount)
 
     def find_dynamic_mount_config(self, mount: str) -> Optional[dict[str, Option]]:
         if mount in self.mounts:
@@ -127,6 +217,7 @@ class Config:
                 pretty_path = re.sub(r'[-+./]', " ", path).title()
                 neew["name"]  = conf["name"].format(path=path, pretty_path=pretty_path)
                 neew["input"] = conf["input"].format(path=path, pretty_path=pretty_path)
+                neew["inputs"] = parse_inputs(neew["input"])
                 neew["genre"] = conf["genre"].format(path=path, pretty_path=pretty_path)
                 neew["dynamic"] = None
                 self.mounts[mount] = neew
@@ -0,0 +1,81 @@
+# icelaunch: Drain sources and metadata updaters on shutdown
+#
+# Copyright Jeremy Sanders (2023)
+# Released under the MIT Licence
+
+import threading
+import time
+import logging
+
+from . import sources, metadata, watchdog
+
+# time allowed for killed processes to be reaped
+KILL_GRACE = 1.0
+
+def drain_source(mount, popen, deadline):
+    '''Terminate source process, killing it if still running at deadline.'''
+    watchdog.remove_watchdog(mount)
+    sources.active_inputs.pop(mount, None)
+    sources.terminate_process(popen, max(deadline - time.monotonic(), 0.0))
+    return True
+
+def drain_updater(updater, deadline):
+    updater.join(max(deadline - time.monotonic(), 0.0))
+    return not updater.is_alive()
+
+def drain(server, timeout):
+    '''Stop all sources and metadata updaters of server in parallel.
+
+    Sources get SIGTERM and are killed if still running after timeout.
+    Updaters are daemon threads and are abandoned if they do not finish
+    in time (e.g. blocked reading the stream). Returns the time each
+    component took to drain, None for those that did not finish.
+    '''
+    start = time.monotonic()
+    deadline = start + timeout
+    timings = {}
+    # stop watchers and listener callbacks starting new sources
+    server.draining = True
+    server.linger.clear()
+
+    def timed(name, func, *args):
+        if func(*args):
+            timings[name] = time.monotonic() - start
+
+    threads = {}
+    for mount in list(server.mount_processes):
+        # a watcher may be restarting the source under the mount lock;
+        # if it takes too long, its new process is stopped by the watcher
+        lock = server.mount_locks[mount]
+        locked = lock.acquire(timeout=max(deadline - time.monotonic(), 0.0))
+        try:
+            popen = server.mount_processes.pop(mount, None)
+        finally:
+            if locked:
+                lock.release()
+            else:
+                logging.warning('mount "%s" still locked, draining anyway' % mount)
+        if popen is not None:
+            threads['source:%s' % mount] = (drain_source, mount, popen, deadline)
+    for mount in list(metadata.updaters):
+        updater = metadata.updaters.pop(mount, None)
+        if updater is not None:
+            updater.stop()
+            threads['metadata:%s' % mount] = (drain_updater, updater, deadline)
+
+    for name, args in threads.items():
+        threads[name] = threading.Thread(
+            target=timed, args=(name,) + args, daemon=True, name='drain-%s' % name)
+        threads[name].start()
+    for thread in threads.values():
+        thread.join(max(deadline + KILL_GRACE - time.monotonic(), 0.0))
+
+    for name in threads:
+        if name in timings:
+            logging.info('drained %s in %.2f seconds' % (name, timings[name]))
+        else:
+            timings[name] = None
+            logging.warning('%s did not drain within %.1f seconds' % (name, timeout))
+    logging.info('drained %d component(s) in %.2f seconds' % (
+        len(threads), time.monotonic() - start))
+    return timings
@@ -0,0 +1,132 @@
+# icelaunch: Keep idle sources running for returning listeners
+#
+# Copyright Jeremy Sanders (2023)
+# Released under the MIT Licence
+
+import collections
+import threading
+import time
+import logging
+
+allowed_policies = {'lru', 'probability'}
+
+class LingerPool:
+    '''Keep recently idle sources warm under a global budget.
+
+    Kodi seems to connect repeatedly when starting to play, and listeners
+    often come back after a short break, so sources are kept running for
+    a while after their last listener left. At most max_warm idle sources
+    are kept; beyond that, the least recently used one, or the one least
+    likely to be listened to again within the linger time, is stopped.
+
+    expire is called with the mount whose idle source should be stopped.
+    It must call release() under the mount lock and only stop the source
+    if that returns True.
+    '''
+    HISTORY = 32 # number of re-listen gaps kept per mount
+
+    def __init__(self, conf, expire):
+        self.expire = expire
+        self.linger_time = conf.main['linger_time']
+        if self.linger_time is None:
+            self.linger_time = conf.main['source_remove_delay']
+        self.max_warm = conf.main['linger_max_warm']
+        self.policy = conf.main['linger_policy']
+        if self.policy not in allowed_policies:
+            raise RuntimeError('Linger policy "%s" is unknown' % self.policy)
+
+        self.lock = threading.Lock()
+        self.idle = collections.OrderedDict() # mount -> timer, least recently used first
+        self.idle_since = {}                  # mount -> time its last listener left
+        self.gaps = {}                        # mount -> recent re-listen gaps
+        self.hits = collections.Counter()     # listeners returning to a warm source
+        self.cold_starts = collections.Counter()
+        self.returning = set()                # mounts whose listener came back
+
+    def return_probability(self, mount):
+        '''Estimated chance of a listener returning within the linger time.'''
+        gaps = self.gaps.get(mount, ())
+        returned = sum(1 for gap in gaps if gap <= self.linger_time)
+        return (returned + 1) / (len(gaps) + 2)
+
+    def park(self, mount):
+        '''Mount lost its last listener. Returns the mounts to expire now.'''
+        with self.lock:
+            self.idle_since[mount] = time.monotonic()
+            if self.linger_time <= 0:
+                self.idle[mount] = None
+                return [mount]
+
+            logging.debug(f"keeping source for mount {mount} for {self.linger_time} seconds")
+            timer = threading.Timer(self.linger_time, self.expire, args=(mount,))
+            timer.daemon = True
+            self.idle[mount] = timer
+            self.idle.move_to_end(mount)
+            timer.start()
+
+            if self.max_warm is None or len(self.idle) <= self.max_warm:
+                return []
+            candidates = list(self.idle)
+            if self.policy == 'probability':
+                candidates.sort(key=self.return_probability)
+            return candidates[:len(self.idle) - self.max_warm]
+
+    def release(self, mount):
+        '''Remove mount from the pool. Returns whether it was idle.'''
+        with self.lock:
+            if mount not in self.idle:
+                return False
+            timer = self.idle.pop(mount)
+        if timer is not None:
+            timer.cancel()
+        return True
+
+    def resume(self, mount):
+        '''Mount got its first listener. Returns whether it was idle.'''
+        with self.lock:
+            since = self.idle_since.pop(mount, None)
+            if since is not None:
+                self.returning.add(mount)
+                gaps = self.gaps.setdefault(mount, collections.deque(maxlen=self.HISTORY))
+                gaps.append(time.monotonic() - since)
+        return self.release(mount)
+
+    def started(self, mount, warm):
+        '''Count whether a returning listener found the source running.'''
+        with self.lock:
+            if mount not in self.returning:
+                return
+            self.returning.discard(mount)
+            if warm:
+                self.hits[mount] += 1
+            else:
+                self.cold_starts[mount] += 1
+
+    def clear(self):
+        '''Cancel all linger timers.'''
+        with self.lock:
+            timers = list(self.idle.values())
+            self.idle.clear()
+        for timer in timers:
+            if timer is not None:
+                timer.cancel()
+
+    def status(self):
+        with self.lock:
+            now = time.monotonic()
+            mounts = set(self.gaps) | set(self.hits) | set(self.cold_starts)
+            return {
+                'policy': self.policy,
+                'linger_time': self.linger_time,
+                'max_warm': self.max_warm,
+                'hits': sum(self.hits.values()),
+                'cold_starts': sum(self.cold_starts.values()),
+                'idle': {m: now - self.idle_since[m] for m in self.idle if m in self.idle_since},
+                'mounts': {
+                    m: {
+                        'hits': self.hits[m],
+                        'cold_starts': self.cold_starts[m],
+                        'return_probability': self.return_probability(m),
+                    } for m in sorted(mounts)
+                },
+            }
@@ -1,4 +1,5 @@
-import re, threading, requests
+import re, time, threading, statistics, collections, requests
+from typing import Any, Optional
 from . import streammeta, api
 from .. import config
 import logging
@@ -11,32 +12,103 @@ SKIP_ADV     = ("StreamTitle", re.compile(r"^(RADIO BOB|Bayern).*", re.I))
 
 class Updater(threading.Thread):
     MAX_ERRORS = 16
+    DEFAULT_INTERVAL = 10.0
+    HISTORY = 8 # number of title durations to learn from
 
-    def __init__(self, mount: str, conf: config.Config) -> None:
-        super().__init__()
+    def __init__(self, mount: str, conf: config.Config, stream: Optional[str] = None,
+                 target: Optional[dict[str, Any]] = None) -> None:
+        super().__init__(daemon=True)
         self.mount  = mount
         self.conf   = conf
-        self.stream = conf.mounts[mount]["input"]
-        self.update_url = UPDATE_URL.format(host=conf.main["icecast_host"], port=conf.main["icecast_port"])
-        self.auth = (conf.main["icecast_admin"], conf.main["icecast_admin_password"])
+        self.stream = stream if stream is not None else conf.mounts[mount]["inputs"][0][0]
+        target = target or conf.icecast["main"]
+        self.update_url = UPDATE_URL.format(host=target["host"], port=target["port"])
+        self.auth = (target["admin"], target["admin_password"])
         self.last = None
         self.errcnt = 0
         self.stopping = threading.Event()
-    
+
+        mount_conf = conf.mounts[mount]
+        self.min_interval  = mount_conf["meta_min_interval"]
+        self.max_interval  = mount_conf["meta_max_interval"]
+        self.idle_interval = max(mount_conf["meta_idle_interval"], self.max_interval)
+        self.idle_after    = mount_conf["meta_idle_after"]
+        self.max_retry     = mount_conf["meta_max_retry"]
+        if self.max_retry is None:
+            self.max_retry = streammeta.MAX_RETRY
+
+        self.seen = None          # last title seen in the stream (pushed or not)
+        self.changed: Optional[float] = None # monotonic time of the last title change
+        self.durations: collections.deque[float] = collections.deque(maxlen=self.HISTORY)
+        self.empty = 0            # consecutive polls without usable metadata
+        self.skipping = False     # last poll ran out of advert skip retries
+        self.skip_exhausted = 0
+        self.polls = 0
+        self.interval = self._clamp(self.DEFAULT_INTERVAL)
+
+    def _clamp(self, interval: float) -> float:
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def expected_duration(self) -> Optional[float]:
+        """Typical title duration learned from the observed changes."""
+        return statistics.median(self.durations) if self.durations else None
+
+    def next_interval(self) -> float:
+        """ Poll more often as a title change becomes due and back off once it is overdue.
+            Streams without usable metadata drop to a slow probe, exhausted advert skips to the maximum interval."""
+        if self.empty >= self.idle_after:
+            return self.idle_interval
+        if self.skipping:
+            return self.max_interval
+        expected = self.expected_duration()
+        if expected is None or self.changed is None:
+            return self._clamp(self.DEFAULT_INTERVAL)
+        remaining = expected - (time.monotonic() - self.changed)
+        if remaining > 0:
+            return self._clamp(remaining / 2)
+        return self._clamp(self.min_interval - remaining / 2)
+
+    def title_changed(self, val: str) -> None:
+        now = time.monotonic()
+        if self.changed is not None:
+            self.durations.append(now - self.changed)
+        self.changed = now
+        self.seen = val
+
+    def no_metadata(self) -> None:
+        self.empty += 1
+        if self.empty == self.idle_after:
+            logging.info(f"No metadata for {self.mount} after {self.empty} polls, probing every {self.idle_interval} seconds")
+
     def update(self) -> None:
+        self.polls += 1
         try:
-            meta = streammeta.get_meta(url=self.stream, skip_meta=SKIP_ADV)
-            if meta is None:
-                logging.debug(f"No metadata returned for {self.mount}")
-                return
+            meta = streammeta.get_meta(url=self.stream, skip_meta=SKIP_ADV, max_retry=self.max_retry)
+        except streammeta.MetaError as exc:
+            logging.debug(f"Skipping adverts for {self.mount} failed: {exc}")
+            self.skipping = True
+            self.skip_exhausted += 1
+            return
         except Exception as exc:
+            # e.g. the stream is unreachable, back off like for a stream without metadata
             logging.error(f"Error reading stream metadata: {exc}", exc_info=True)
+            self.skipping = False
+            self.no_metadata()
             return
+        self.skipping = False
 
-        if meta.get("StreamTitle") is None:
-            logging.warning(f"No usable metadata for {self.mount} in {meta}")
+        if meta is None or meta.get("StreamTitle") is None:
+            if meta is None:
+                logging.debug(f"No metadata returned for {self.mount}")
+            else:
+                logging.warning(f"No usable metadata for {self.mount} in {meta}")
+            self.no_metadata()
             return
+        self.empty = 0
+
         val = meta["StreamTitle"]
+        if val != self.seen:
+            self.title_changed(val)
         if val == self.last:
             logging.debug(f"Metadata for {self.mount} already set to {self.last}")
             return
@@ -54,12 +126,15 @@ class Updater(threading.Thread):
 
     def run(self) -> None:
         self.update()
-        while not self.stopping.wait(10.0):
+        self.interval = self.next_interval()
+        while not self.stopping.wait(self.interval):
             self.update()
             if self.errcnt >= self.MAX_ERRORS:
                 logging.error(f"Metadata updater for {self.mount} stopping after {self.errcnt} errors.")
                 remove_updater(self.mount, self.conf, wait=False)
                 break
+            self.interval = self.next_interval()
+            logging.debug(f"Next metadata poll for {self.mount} in {self.interval:.1f} seconds")
 
         logging.debug(f"Metadata updater for {self.mount} stopping.")
 
@@ -68,7 +143,8 @@ class Updater(threading.Thread):
 
 updaters: dict[str, Updater] = {}
 
-def add_updater(mount: str, conf: config.Config):
+def add_updater(mount: str, conf: config.Config, stream: Optional[str] = None,
+                target: Optional[dict[str, Any]] = None):
     if not conf.mounts[mount]["meta"]:
         logging.debug(f"Metadata updating not requested for '{mount}'")
         return
@@ -76,7 +152,7 @@ def add_updater(mount: str, conf: config.Config):
         logging.debug(f"Metadata updater for '{mount}' already running")
         return
     streammeta.DEBUG = conf.main["log_debug_metadata"]
-    thread = Updater(mount, conf)
+    thread = Updater(mount, conf, stream, target)
     thread.start()
     updaters[mount] = thread
     logging.info(f"Metadata updater for {mount} started.")
@@ -90,8 +166,3 @@ def remove_updater(mount, _conf, wait=True):
     thread.stop()
     if wait: thread.join()
     logging.info(f"Metadata updater for {mount} stopped.")
-
-def remove_all_updater(conf):
-    logging.debug("Removing all remaining metadata updaters")
-    for mount in list(updaters.keys()): # NOSONAR(S7504) updaters is modified in loop!
-        remove_updater(mount, conf)
@@ -1,13 +1,18 @@
  
-def status() -> dict[str, dict[str, str | int]]:
+def status() -> dict[str, dict[str, str | int | float | None]]:
     from . import updaters
 
-    status_dict: dict[str, dict[str, str | int]] = {}
+    status_dict: dict[str, dict[str, str | int | float | None]] = {}
     for mount, updater in updaters.items():
         status_dict[mount] = {
             "mount": updater.mount,
             "stream": updater.stream,
             "title": updater.last,
             "error_count": updater.errcnt,
+            "interval": updater.interval,
+            "poll_count": updater.polls,
+            "empty_polls": updater.empty,
+            "skip_exhausted": updater.skip_exhausted,
+            "expected_duration": updater.expected_duration(),
         }
     return status_dict
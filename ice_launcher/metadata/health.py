@@ -20,24 +20,36 @@ def check_status(args: argparse.Namespace, data: dict[str, Any]) -> int:
     if "icecast" not in data:
         print("Error: 'icecast' section missing in status data", file=sys.stderr)
         args.errors += 1
-    icecast = data.get("icecast", {})
+    # totals over all icecast servers, if there are several
+    icecast = data.get("icecast_total", data.get("icecast", {}))
     icecast_sources = icecast.get("source", {})
+    # idle sources kept running for returning listeners have no clients
+    idle = set(data.get("linger", {}).get("idle", {}))
+    active_sources = {m: s for m, s in icecast_sources.items() if m.lstrip("/") not in idle}
     
     ns = len(icecast_sources)
+    na = len(active_sources)
     nl = icecast.get("listeners", 0)
     nc = sum(len(clients) for clients in data.get("clients", {}).values())
     np = len(data.get("processes", {}))
     nd = len(data.get("metadata", {}))
-    if ns != nc: args.errors += 1
+    if na != nc: args.errors += 1
     if ns != np: args.errors += 1
-    if ns >  0 and nl == 0: args.errors += 1
+    if na >  0 and nl == 0: args.errors += 1
     if np >  nd: args.warnings += 1
     verbose(args, f"Found {ns} mount(s) on icecast server.")
+    verbose(args, f"Found {ns - na} idle mount(s) kept running by ice-launcher.")
     verbose(args, f"Found {nl} listeners(s) connected to icecast server.")
     verbose(args, f"Found {nc} total client(s) connected to ice-launcher.")
     verbose(args, f"Found {np} mount process(es) running on ice-launcher.")
     verbose(args, f"Found {nd} metadata updater(s) running on ice-launcher.")
-    stale = dict(filter(lambda m: int(m[1].get("listeners", 0)) == 0, icecast_sources.items()))
+    for name, target in data.get("targets", {}).items():
+        if target.get("error"):
+            args.errors += 1
+            verbose(args, f"Icecast server '{name}' is not reachable: {target['error']}")
+        else:
+            verbose(args, f"Icecast server '{name}' has {target.get('listeners')} listener(s) on {len(target.get('mounts', []))} placed mount(s).")
+    stale = dict(filter(lambda m: int(m[1].get("listeners", 0)) == 0, active_sources.items()))
     for mount, source in stale.items():
         args.errors += 1
         verbose(args, f"Mount '{mount}' has no more listeners connected.")
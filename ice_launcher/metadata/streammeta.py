@@ -15,7 +15,7 @@ def _open_stream(url, cookiejar=None):
 
 class MetaError(RuntimeError): pass
 
-def get_meta(url, skip_meta=None, cookiejar=None):
+def get_meta(url, skip_meta=None, cookiejar=None, max_retry=MAX_RETRY):
   response = _open_stream(url, cookiejar=cookiejar) 
   meta = None
 
@@ -23,7 +23,7 @@ def get_meta(url, skip_meta=None, cookiejar=None):
     icy_metaint_header = response.headers.get('icy-metaint')
     if icy_metaint_header is not None and int(icy_metaint_header) != 0:
       metaint = int(icy_metaint_header)
-      retry   = MAX_RETRY
+      retry   = max_retry
       while retry > 0:
         read_buffer = metaint # +255
         content = response.read(read_buffer)
@@ -0,0 +1,148 @@
+# icelaunch: On-demand profiling of the running launcher
+#
+# Copyright Jeremy Sanders (2023)
+# Released under the MIT Licence
+
+import sys, os, json, time, threading, traceback, collections, tracemalloc
+from typing import Optional
+
+MAX_SECONDS = 300.0
+MIN_INTERVAL = 0.001
+# tracing slows down allocations, so it stops by itself this long after the last call
+ALLOC_TIMEOUT = 600.0
+
+class Sampler(threading.Thread):
+    """Sample the stacks of all other threads for a while.
+
+    The result is in collapsed stack format (one "frame;frame;... count"
+    line per stack), as used by flame graph tools.
+    """
+
+    def __init__(self, seconds: float, interval: float) -> None:
+        super().__init__(daemon=True, name="profiler")
+        self.seconds = seconds
+        self.interval = interval
+        self.stacks: collections.Counter[str] = collections.Counter()
+        self.samples = 0
+
+    def run(self) -> None:
+        end = time.monotonic() + self.seconds
+        while time.monotonic() < end:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == self.ident:
+                    continue
+                self.stacks[collapse(names.get(ident, str(ident)), frame)] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+def collapse(thread_name: str, frame) -> str:
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        frames.append(f"{module}:{code.co_name}")
+        frame = frame.f_back
+    frames.append(thread_name.replace(";", ":").replace(" ", "_"))
+    return ";".join(reversed(frames))
+
+sampler: Optional[Sampler] = None
+snapshot: Optional[tracemalloc.Snapshot] = None
+alloc_timer: Optional[threading.Timer] = None
+
+def stop_tracing() -> None:
+    global snapshot
+    tracemalloc.stop()
+    snapshot = None
+
+def arm_alloc_timer() -> None:
+    """(Re)start the timer stopping allocation tracing."""
+    global alloc_timer
+    if alloc_timer is not None:
+        alloc_timer.cancel()
+    alloc_timer = threading.Timer(ALLOC_TIMEOUT, stop_tracing)
+    alloc_timer.daemon = True
+    alloc_timer.start()
+
+def profile(query: dict[str, str]) -> tuple[int, str, str]:
+    """Start a sampling run with ?seconds=N, otherwise fetch the last result."""
+    global sampler
+    if sampler is not None and sampler.is_alive():
+        return 202, "application/json", json.dumps({"status": "running", "seconds": sampler.seconds})
+    if "seconds" in query:
+        seconds = float(query["seconds"])
+        interval = float(query.get("interval", 0.01))
+        if not 0 < seconds <= MAX_SECONDS or interval < MIN_INTERVAL:
+            raise ValueError("seconds or interval out of range")
+        sampler = Sampler(seconds, interval)
+        sampler.start()
+        return 202, "application/json", json.dumps({"status": "started", "seconds": seconds})
+    if sampler is None:
+        return 404, "application/json", json.dumps({"status": "no profile recorded"})
+    return 200, "text/plain", sampler.collapsed()
+
+def threads(_query: dict[str, str]) -> tuple[int, str, str]:
+    """Current stack of every thread."""
+    frames = sys._current_frames()
+    lines = []
+    for thread in threading.enumerate():
+        lines.append(f'"{thread.name}" {type(thread).__name__} ident={thread.ident} daemon={thread.daemon}\n')
+        frame = frames.get(thread.ident) if thread.ident is not None else None
+        if frame is not None:
+            lines.extend(traceback.format_stack(frame))
+        lines.append("\n")
+    return 200, "text/plain", "".join(lines)
+
+def alloc(query: dict[str, str]) -> tuple[int, str, str]:
+    """Top allocators, and growth since the last snapshot.
+
+    The first call starts tracing allocations, ?stop=1 stops it again.
+    Tracing also stops ALLOC_TIMEOUT seconds after the last call.
+    """
+    global snapshot
+    if "stop" in query:
+        if alloc_timer is not None:
+            alloc_timer.cancel()
+        stop_tracing()
+        return 200, "application/json", json.dumps({"status": "stopped"})
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(int(query.get("frames", 1)))
+        snapshot = None
+        arm_alloc_timer()
+        return 202, "application/json", json.dumps({"status": "started", "timeout": ALLOC_TIMEOUT})
+    arm_alloc_timer()
+
+    limit = int(query.get("limit", 20))
+    current = tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(False, tracemalloc.__file__)])
+    size, peak = tracemalloc.get_traced_memory()
+    result = {
+        "timeout": ALLOC_TIMEOUT,
+        "traced": size,
+        "peak": peak,
+        "top": [
+            {"where": str(stat.traceback), "size": stat.size, "count": stat.count}
+            for stat in current.statistics("lineno")[:limit]
+        ],
+        "growth": [
+            {"where": str(stat.traceback), "size_diff": stat.size_diff, "count_diff": stat.count_diff}
+            for stat in current.compare_to(snapshot, "lineno")[:limit]
+        ] if snapshot is not None else None,
+    }
+    snapshot = current
+    return 200, "application/json", json.dumps(result, indent=4)
+
+handlers = {
+    "profile": profile,
+    "threads": threads,
+    "alloc": alloc,
+}
+
+def handle(name: str, query: dict[str, str]) -> tuple[int, str, str]:
+    """Run debug endpoint name. Returns status code, content type and body."""
+    if name not in handlers:
+        return 404, "text/plain", "Error 404: Not found"
+    return handlers[name](query)
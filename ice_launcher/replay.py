@@ -0,0 +1,211 @@
+# icelaunch: Replay captured icecast callbacks
+#
+# Copyright Jeremy Sanders (2023)
+# Released under the MIT Licence
+
+import sys, os, time, stat, shutil, tempfile, threading, statistics, argparse, logging
+import urllib.parse, urllib.request
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Any
+
+from . import config, capture, sources
+from .main import __version__
+from .server import LauncherHTTPServer, HTTPHandler
+
+# ffmpeg stand-in: ignores its arguments and runs until terminated
+STANDIN_FFMPEG = """#!{python}
+import signal, sys, time
+signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+while True:
+    time.sleep(60)
+"""
+
+class StandInIcecastHandler(BaseHTTPRequestHandler):
+    """Accepts metadata updates and serves empty stats."""
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml")
+        self.end_headers()
+        if self.path.startswith("/admin/stats"):
+            self.wfile.write(b"<icestats><listeners>0</listeners></icestats>")
+
+    def log_message(self, format, *args): # NOSONAR(S1172) silence the access log
+        pass
+
+class QuietHTTPHandler(HTTPHandler):
+    def log_message(self, format, *args): # NOSONAR(S1172) silence the access log
+        pass
+
+def start_standin_icecast() -> HTTPServer:
+    icecast = HTTPServer(("127.0.0.1", 0), StandInIcecastHandler)
+    threading.Thread(target=icecast.serve_forever, daemon=True).start()
+    return icecast
+
+def install_standin_ffmpeg(bindir: str) -> None:
+    path = os.path.join(bindir, "ffmpeg")
+    with open(path, "w") as f:
+        f.write(STANDIN_FFMPEG.format(python=sys.executable))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+    os.environ["PATH"] = os.pathsep.join([bindir, os.environ["PATH"]])
+
+def standin_target(name: str, icecast: HTTPServer) -> dict[str, Any]:
+    host, port = icecast.server_address[:2]
+    return {
+        "name": name, "host": host, "port": port, "group": "standin", "legacy": False,
+        "user": "source", "password": "standin", "admin": "admin", "admin_password": "standin",
+    }
+
+def prepare_config(args: argparse.Namespace, icecasts: list[HTTPServer]) -> config.Config:
+    """Point the configuration at the stand-ins, with timings scaled to the replay speed."""
+    conf = config.Config(args.config)
+    conf.main["listen_address"] = "127.0.0.1"
+    conf.main["listen_port"] = 0
+    conf.icecast = {"main": standin_target("main", icecasts[0])}
+    for i, icecast in enumerate(icecasts[1:], 1):
+        conf.icecast[f"standin{i}"] = standin_target(f"standin{i}", icecast)
+    conf.main["capture_file"] = None
+    conf.main["session_file"] = None
+    conf.main["input_probe"] = False
+    conf.main["stall_window"] = 0.0
+    wait = args.ffmpeg_wait if args.ffmpeg_wait is not None else conf.main["ffmpeg_wait"]
+    conf.main["ffmpeg_wait"] = wait / args.speed
+    delay = args.linger_time
+    if delay is None:
+        delay = conf.main["linger_time"] if conf.main["linger_time"] is not None else conf.main["source_remove_delay"]
+    conf.main["linger_time"] = delay / args.speed
+    if args.max_warm is not None:
+        conf.main["linger_max_warm"] = args.max_warm
+    conf.allow_users = {}
+    for mount_conf in conf.mounts.values():
+        mount_conf["meta"] = False
+    return conf
+
+def post(url: str, event: dict[str, Any]) -> float:
+    data = urllib.parse.urlencode(event).encode("utf-8")
+    start = time.perf_counter()
+    with urllib.request.urlopen(url, data=data) as rsp:
+        rsp.read()
+    return time.perf_counter() - start
+
+def percentiles(values: list[float]) -> str:
+    if len(values) < 2:
+        return " ".join(f"{v * 1000:.1f}ms" for v in values)
+    q = statistics.quantiles(values, n=100, method="inclusive")
+    return f"p50={q[49] * 1000:.1f}ms p95={q[94] * 1000:.1f}ms p99={q[98] * 1000:.1f}ms max={max(values) * 1000:.1f}ms"
+
+def replay(args: argparse.Namespace, conf: config.Config) -> dict[str, Any]:
+    events = [e for e in capture.read_capture(args.capture) if "action" in e]
+    if not events:
+        raise RuntimeError(f"No events in capture '{args.capture}'")
+
+    # count every ffmpeg spawned, including restarts, by the server it was sent to
+    placed: dict[str, int] = {name: 0 for name in conf.icecast}
+    launch_ffmpeg = sources.launch_ffmpeg
+
+    def counting_launch_ffmpeg(mount, launch_conf, url, target):
+        popen = launch_ffmpeg(mount, launch_conf, url, target)
+        placed[target["name"]] += 1
+        return popen
+
+    handler = HTTPHandler if args.verbose else QuietHTTPHandler
+    httpd = LauncherHTTPServer(conf, (conf.main["listen_address"], conf.main["listen_port"]), handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = "http://%s:%d/" % httpd.server_address[:2]
+
+    latencies: dict[str, list[float]] = {}
+    peak = 0
+    lag = 0.0
+    t0 = events[0]["t"]
+    start = time.monotonic()
+    sources.launch_ffmpeg = counting_launch_ffmpeg
+    try:
+        for event in events:
+            due = start + (event["t"] - t0) / args.speed
+            now = time.monotonic()
+            if due > now:
+                time.sleep(due - now)
+            else:
+                lag = max(lag, now - due)
+            params = {k: v for k, v in event.items() if k != "t"}
+            latencies.setdefault(event["action"], []).append(post(url, params))
+
+            peak = max(peak, len(httpd.mount_processes))
+        elapsed = time.monotonic() - start
+        # let idle sources expire
+        time.sleep(conf.main["linger_time"])
+        linger = httpd.linger.status()
+    finally:
+        sources.launch_ffmpeg = launch_ffmpeg
+        httpd.shutdown()
+        for mount in list(httpd.mount_processes):
+            with httpd.mount_locks[mount]:
+                httpd.mount_clients[mount].clear()
+                popen = httpd.mount_processes.pop(mount)
+                sources.stop_source(popen, mount, conf)
+        httpd.server_close()
+
+    return {
+        "events": len(events),
+        "capture_duration": events[-1]["t"] - t0,
+        "replay_duration": elapsed,
+        "max_lag": lag,
+        "latencies": latencies,
+        "spawned": sum(placed.values()),
+        "placed": placed,
+        "peak_processes": peak,
+        "warm_hits": linger["hits"],
+        "cold_starts": linger["cold_starts"],
+    }
+
+def report(args: argparse.Namespace, result: dict[str, Any]) -> None:
+    print(f"Replayed {result['events']} callbacks at {args.speed:g}x "
+          f"({result['capture_duration']:.1f}s captured, {result['replay_duration']:.1f}s replayed, "
+          f"max lag {result['max_lag'] * 1000:.1f}ms)")
+    for action, values in sorted(result["latencies"].items()):
+        print(f"  {action}: {len(values)} callbacks, latency {percentiles(values)}")
+    print(f"  ffmpeg processes spawned: {result['spawned']}")
+    if len(result["placed"]) > 1:
+        for name, count in result["placed"].items():
+            print(f"    placed on icecast {name}: {count}")
+    print(f"  peak concurrent processes: {result['peak_processes']}")
+    print(f"  returning listeners: {result['warm_hits']} warm, {result['cold_starts']} cold start(s)")
+
+def main(argv=tuple(sys.argv[1:])) -> int:
+    ap = argparse.ArgumentParser(description="Replay captured icecast callbacks against stand-in ffmpeg and icecast processes")
+    ap.add_argument(       "capture",        help="Capture file written with the capture_file option")
+    ap.add_argument(       "--config",       default="ice_launcher.conf", help="Launcher configuration file")
+    ap.add_argument("-s", "--speed",         default=1.0,  type=float, help="Replay speed, 1 to 100 times real time")
+    ap.add_argument(       "--linger-time",  default=None, type=float, help="Override linger_time (capture seconds)")
+    ap.add_argument(       "--max-warm",     default=None, type=int,   help="Override linger_max_warm")
+    ap.add_argument(       "--ffmpeg-wait",  default=None, type=float, help="Override ffmpeg_wait (capture seconds)")
+    ap.add_argument(       "--icecast",      default=1,    type=int,   help="Number of stand-in icecast servers")
+    ap.add_argument("-v", "--verbose",       default=False, action="store_true", help="Show launcher log output")
+    ap.add_argument("-V", "--version",       action="version", version=f"%(prog)s {__version__}, Python {sys.version}")
+    args = ap.parse_args(argv)
+
+    if not 1.0 <= args.speed <= 100.0:
+        ap.error("speed must be between 1 and 100")
+    if args.icecast < 1:
+        ap.error("at least one icecast server is needed")
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    bindir = tempfile.mkdtemp(prefix="ice_launcher_replay")
+    icecasts = [start_standin_icecast() for _ in range(args.icecast)]
+    try:
+        install_standin_ffmpeg(bindir)
+        conf = prepare_config(args, icecasts)
+        result = replay(args, conf)
+    except Exception as exc:
+        print(f"Error replaying '{args.capture}': {exc}", file=sys.stderr)
+        return 1
+    finally:
+        for icecast in icecasts:
+            icecast.shutdown()
+        shutil.rmtree(bindir, ignore_errors=True)
+
+    report(args, result)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
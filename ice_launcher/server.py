@@ -5,12 +5,24 @@
 
 from http.server import BaseHTTPRequestHandler, HTTPServer
 import urllib.parse
+import ipaddress
+import binascii
+import base64
 import logging
+import json
+import signal
 import threading
+import time
 
-from . import sources, metadata, api
+from . import sources, metadata, watchdog, api, capture, drain, linger, targets, profiling, sessions
 
 class LauncherHTTPServer(HTTPServer):
+    # delay before restarting a failed source, doubling while it keeps
+    # failing, and the time after which a failure counts as the first
+    RESTART_BACKOFF = 1.0
+    RESTART_BACKOFF_MAX = 60.0
+    RESTART_RESET = 300.0
+
     def __init__(self, conf, *args, **argsv):
         HTTPServer.__init__(self, *args, **argsv)
         self.conf = conf
@@ -25,6 +37,27 @@ class LauncherHTTPServer(HTTPServer):
         # this maps mounts to Popen processes
         self.mount_processes = {}
         self.global_lock = threading.Lock()
+        # set when shutting down, so no sources are started any more
+        self.draining = False
+        # mount -> (consecutive restarts, time of the last one)
+        self.restarts = {}
+        # idle sources kept running for returning listeners
+        self.linger = linger.LingerPool(conf, self.expire_source)
+        # icecast servers the sources are placed on
+        self.targets = targets.TargetPool(conf)
+        # history of listener sessions
+        self.sessions = sessions.SessionStore(conf)
+
+        # optional recording of icecast callbacks for replay
+        self.capture = None
+        if conf.main['capture_file']:
+            self.capture = capture.Capture(conf.main['capture_file'])
+            logging.info('capturing icecast callbacks to "%s"' % conf.main['capture_file'])
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+        if self.capture is not None:
+            self.capture.close()
 
     def add_dynamic_mount(self, mount, conf):
         with self.global_lock:
@@ -32,6 +65,82 @@ class LauncherHTTPServer(HTTPServer):
             self.mount_clients[mount] = set()
             conf["dynamic"] = False
 
+    def expire_source(self, mount):
+        """Stop the idle source for mount, unless it got a listener again."""
+        with self.mount_locks[mount]:
+            if self.draining or not self.linger.release(mount) or self.mount_clients[mount]:
+                return
+            popen = self.mount_processes.pop(mount, None)
+            if popen is not None:
+                logging.info('stopping source for mount "%s"' % mount)
+                sources.stop_source(popen, mount, self.conf)
+            self.targets.release(mount)
+
+    def watch_source(self, mount, popen):
+        """Fail over to another input if the source process exits by itself."""
+        threading.Thread(
+            target=self._watch_source, args=(mount, popen), daemon=True,
+            name=f"watch-{mount}").start()
+
+    def restart_delay(self, mount):
+        """Back off exponentially from sources which keep failing."""
+        now = time.monotonic()
+        count, last = self.restarts.get(mount, (0, 0.0))
+        if now - last > self.RESTART_RESET:
+            count = 0
+        delay = min(self.RESTART_BACKOFF * 2 ** (count - 1), self.RESTART_BACKOFF_MAX) if count else 0.0
+        self.restarts[mount] = (count + 1, now + delay)
+        return delay
+
+    def _watch_source(self, mount, popen):
+        popen.wait()
+        with self.mount_locks[mount]:
+            # stopped or replaced on purpose
+            if self.draining or self.mount_processes.get(mount) is not popen:
+                return
+            failed = sources.input_failed(mount)
+            if not self.mount_clients[mount]:
+                # an idle source kept for returning listeners
+                logging.info('idle source for mount "%s" exited with %s' % (
+                    mount, popen.returncode))
+                self.linger.release(mount)
+                del self.mount_processes[mount]
+                sources.stop_source(popen, mount, self.conf)
+                self.targets.release(mount)
+                return
+            delay = self.restart_delay(mount)
+
+        # listener_add restarts the source itself if it comes first, and
+        # the linger pool stops it if its last listener leaves meanwhile
+        if delay:
+            logging.info('waiting %.0f seconds before restarting source for mount "%s"' % (
+                delay, mount))
+            time.sleep(delay)
+        with self.mount_locks[mount]:
+            if (self.draining or self.mount_processes.get(mount) is not popen
+                    or not self.mount_clients[mount]):
+                return
+            logging.warning(
+                'ffmpeg for mount "%s" exited with %s, switching input' % (
+                    mount, popen.returncode))
+            metadata.remove_updater(mount, self.conf, wait=False)
+            watchdog.remove_watchdog(mount)
+            inputs = self.conf.mounts[mount]['inputs']
+            exclude = {failed} if len(inputs) > 1 else set()
+            try:
+                popen = sources.start_source(
+                    mount, self.conf, exclude=exclude, target=self.targets.target(mount))
+            except sources.IceLaunchError:
+                # leave the dead process in place, listener_add restarts it
+                logging.error('could not restart source for mount "%s"' % mount)
+                return
+            if self.draining:
+                # drain gave up waiting for the lock
+                sources.stop_source(popen, mount, self.conf)
+                return
+            self.mount_processes[mount] = popen
+        self.watch_source(mount, popen)
+
 class HTTPHandler(BaseHTTPRequestHandler):
     KNOWN_UNKNOWNS = [ "server_version.xsl", "status.xsl", "style.css" ]
 
@@ -49,18 +158,17 @@ class HTTPHandler(BaseHTTPRequestHandler):
         self.send_header('icecast-auth-user', '0')
         self.end_headers()
 
-    def start_source(self, mount):
-        """Start source for mount given."""
+    def start_source(self, mount, caller=None):
+        """Start source for mount given, on the least loaded icecast server."""
         logging.info('starting source for mount "%s"' % mount)
-        popen = sources.start_source(mount, self.server.conf)
+        target = self.server.targets.place(mount, caller)
+        try:
+            popen = sources.start_source(mount, self.server.conf, target=target)
+        except sources.IceLaunchError:
+            self.server.targets.release(mount)
+            raise
         self.server.mount_processes[mount] = popen
-
-    def stop_source(self, mount):
-        """Stop the mount source by killing the process."""
-        logging.info('stopping source for mount "%s"' % mount)
-        popen = self.server.mount_processes[mount]
-        del self.server.mount_processes[mount]
-        sources.stop_source(popen, mount, self.server.conf)
+        self.server.watch_source(mount, popen)
 
     def listener_add(self, params):
         """Handle action listener_add from icecast."""
@@ -79,15 +187,42 @@ class HTTPHandler(BaseHTTPRequestHandler):
         if conf["dynamic"] is None:
             self.server.add_dynamic_mount(mount, conf)
 
+        caller = self.server.targets.identify(self.path, params)
+
         with self.server.mount_locks[mount]:
+            if self.server.draining:
+                logging.info('shutting down, refusing listener for mount "%s"' % mount)
+                raise sources.IceLaunchError('shutting down')
             if not self.server.mount_clients[mount]:
-                self.start_source(mount)
+                warm = self.server.linger.resume(mount)
+                popen = self.server.mount_processes.get(mount)
+                if popen is not None and not self.server.targets.serves(mount, caller):
+                    # idle source on a server the caller cannot relay from
+                    logging.info('moving source for mount "%s" to icecast server %s' % (mount, caller))
+                    del self.server.mount_processes[mount]
+                    sources.stop_source(popen, mount, self.server.conf)
+                    self.server.targets.release(mount)
+                    popen = None
+                warm = warm and popen is not None and popen.poll() is None
+                self.server.linger.started(mount, warm)
+                if warm:
+                    logging.info('reusing idle source for mount "%s"' % mount)
+                else:
+                    self.start_source(mount, caller)
+            elif not self.server.targets.serves(mount, caller):
+                logging.warning(
+                    'mount "%s" runs on icecast server %s, refusing listener of %s' % (
+                        mount, self.server.targets.target(mount)['name'], caller))
+                raise sources.IceLaunchError('mount runs on another icecast server')
             elif self.server.mount_processes[mount].poll() is not None:
                 logging.warning(
                     'Process for mount "%s" died! Restarting.' % mount)
+                # e.g. while its watcher waits to restart it
+                sources.stop_source(self.server.mount_processes[mount], mount, self.server.conf)
                 self.start_source(mount)
 
             self.server.mount_clients[mount].add(client)
+            self.server.sessions.open_session(mount, client)
             
             logging.debug("active clients for mount %s: %s" % (mount, str(self.server.mount_clients[mount])))
 
@@ -105,30 +240,25 @@ class HTTPHandler(BaseHTTPRequestHandler):
                         'unknown mount "%s" for listener_remove, so ignoring' % mount)
             return
 
-        delay = self.server.conf.main.get('source_remove_delay')
-        if delay is not None and delay > 0:
-            logging.debug(f"delaying source removal for mount {mount}, client {client} by {delay} seconds")
-            threading.Timer(delay, self._remove_delayed, args=(mount, client, conf)).start()
-        else:
-            self._remove_delayed(mount, client, conf)
-
-    def _remove_delayed(self, mount, client, conf):
-        """ Kodi seems to connect repeatedly when starting to play.
-            So we'll try to keep the source running for a few seconds after the client was removed."""
         if conf["dynamic"] is None:
             self.server.add_dynamic_mount(mount, conf)
 
+        expire = []
         with self.server.mount_locks[mount]:
             if client in self.server.mount_clients[mount]:
                 self.server.mount_clients[mount].remove(client)
+                self.server.sessions.close_session(mount, client)
                 if not self.server.mount_clients[mount]:
                     logging.info('no more clients left for mount "%s"' % mount)
-                    self.stop_source(mount)
+                    expire = self.server.linger.park(mount)
             else:
                 logging.debug(f"client {client} not found in mount {mount} clients")
             if self.server.mount_clients[mount]:
                 logging.debug(f"remaining clients for mount {mount}: {self.server.mount_clients[mount]}")
 
+        # outside the lock, expiring may need the locks of other mounts
+        for idle in expire:
+            self.server.expire_source(idle)
 
     def check_user_password(self, params):
         """Check if provided user details match allowed users."""
@@ -160,6 +290,9 @@ class HTTPHandler(BaseHTTPRequestHandler):
         # keep only first parameters
         params = {k: v[0] for k, v in params.items()}
 
+        if self.server.capture is not None:
+            self.server.capture.record(params)
+
         if params['action'] == 'listener_add':
             # hide status page if requested
             if self.server.conf.main['icecast_forbid_status'] and (
@@ -204,6 +337,63 @@ class HTTPHandler(BaseHTTPRequestHandler):
             self.end_headers()
             self.wfile.write(b'Error 500: Internal server error')
 
+    def debug_allowed(self):
+        """Debug endpoints are for local callers, or allowed users with basic auth."""
+        host = self.client_address[0]
+        try:
+            if ipaddress.ip_address(host).is_loopback:
+                return True
+        except ValueError:
+            pass
+        if host == self.server.conf.main['listen_address']:
+            return True
+
+        auth = self.headers.get('Authorization', '')
+        if not self.server.conf.allow_users or not auth.startswith('Basic '):
+            return False
+        try:
+            user, _, passwd = base64.b64decode(auth[6:]).decode('utf-8').partition(':')
+        except (binascii.Error, UnicodeDecodeError):
+            return False
+        return self.check_user_password({'user': user, 'pass': passwd})
+
+    def send_debug_response(self):
+        """Send profiling data of the launcher."""
+        if not self.debug_allowed():
+            logging.warning('debug request from %s refused' % self.client_address[0])
+            self.send_response(403)
+            self.end_headers()
+            self.wfile.write(b'Error 403: Forbidden')
+            return
+
+        url = urllib.parse.urlsplit(self.path)
+        query = {k: v[0] for k, v in urllib.parse.parse_qs(url.query).items()}
+        try:
+            code, content_type, rsp = profiling.handle(url.path[len('/api/debug/'):], query)
+        except ValueError as exc:
+            code, content_type, rsp = 400, 'text/plain', f'Error 400: {exc}'
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.end_headers()
+        self.wfile.write(rsp.encode('utf-8'))
+
+    def send_sessions_response(self):
+        """Send listener session statistics, optionally for ?mount=X&buckets=N."""
+        url = urllib.parse.urlsplit(self.path)
+        query = {k: v[0] for k, v in urllib.parse.parse_qs(url.query).items()}
+        try:
+            rsp = json.dumps(self.server.sessions.query(
+                query.get('mount'), int(query.get('buckets', 24))), indent=4)
+        except ValueError as exc:
+            self.send_response(400)
+            self.end_headers()
+            self.wfile.write(f'Error 400: {exc}'.encode('utf-8'))
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(rsp.encode('utf-8'))
+
     def do_GET(self):
         """Handle GET request.
 
@@ -212,6 +402,12 @@ class HTTPHandler(BaseHTTPRequestHandler):
         if self.path == "/api/status.json":
             self.send_status_response()
             return
+        if self.path.split('?', 1)[0] == "/api/sessions.json":
+            self.send_sessions_response()
+            return
+        if self.path.startswith("/api/debug/"):
+            self.send_debug_response()
+            return
 
         logging.info(
             'GET path: %s, headers: %s', repr(self.path), repr(self.headers))
@@ -228,11 +424,27 @@ def run_server(conf):
     )
 
     httpd = LauncherHTTPServer(conf, server_address, HTTPHandler)
+
+    def terminate(_signum, _frame):
+        # container runtimes stop us with SIGTERM; shutdown() waits for
+        # serve_forever, which runs in this thread, so call it from another
+        logging.info('SIGTERM received, shutting down')
+        httpd.draining = True
+        threading.Thread(target=httpd.shutdown, daemon=True).start()
+    signal.signal(signal.SIGTERM, terminate)
+
     logging.info('Starting icecast launcher server')
+    httpd.sessions.start()
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
         pass
-    metadata.remove_all_updater(conf)
+    drain.drain(httpd, conf.main['shutdown_deadline'])
+    httpd.sessions.stop()
+    httpd.sessions.close_all()
+    try:
+        httpd.sessions.save()
+    except Exception as exc:
+        logging.error(f"Error saving session store: {exc}")
     httpd.server_close()
     logging.info('Stopping icecast launcher server')
@@ -0,0 +1,251 @@
+# icelaunch: Listener session history
+#
+# Copyright Jeremy Sanders (2023)
+# Released under the MIT Licence
+
+import array
+import bisect
+import json
+import os
+import threading
+import time
+import logging
+
+# upper edges in seconds of the session length histogram bins
+EDGES = (1, 2, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400, 28800)
+MAGIC = b'ICE_LAUNCHER_SESSIONS 1\n'
+
+class Bucket:
+    '''Roll-up of the sessions of one mount starting in one time bucket.'''
+
+    def __init__(self, sessions=0, peak=0, seconds=0.0, histogram=None):
+        self.sessions = sessions
+        self.peak = peak        # peak concurrent listeners
+        self.seconds = seconds  # total listening time of ended sessions
+        self.histogram = array.array('I', histogram or [0] * (len(EDGES) + 1))
+
+    def to_list(self):
+        return [self.sessions, self.peak, self.seconds, self.histogram.tolist()]
+
+def histogram_bin(duration):
+    return bisect.bisect_right(EDGES, duration)
+
+def percentile(histogram, q):
+    '''Estimate the q-th percentile (0-100) of a session length histogram.'''
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = q / 100.0 * total
+    seen = 0
+    for i, count in enumerate(histogram):
+        if count and seen + count >= rank:
+            lower = EDGES[i - 1] if i > 0 else 0.0
+            if i == len(EDGES):
+                return float(lower)
+            return lower + (EDGES[i] - lower) * (rank - seen) / count
+        seen += count
+    return float(EDGES[-1])
+
+class SessionStore(threading.Thread):
+    '''Record listener sessions per mount for capacity analytics.
+
+    Ended sessions go into a fixed size ring buffer of arrays (start,
+    duration, mount index) and are rolled up into per-mount time buckets
+    holding the session count, peak concurrency and a histogram of session
+    lengths. Queries only read the buckets. The thread refreshes the peak
+    of buckets without listener changes, prunes old buckets and saves the
+    store to session_file, if set.
+    '''
+
+    def __init__(self, conf):
+        super().__init__(daemon=True, name='sessions')
+        self.capacity = conf.main['session_capacity']
+        self.bucket_size = conf.main['session_bucket']
+        self.retention = conf.main['session_retention']
+        self.filename = conf.main['session_file']
+        self.save_interval = conf.main['session_save_interval']
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+
+        self.mounts = []         # mount names, indexed by the arrays
+        self.mount_index = {}
+        self.open = {}           # (mount, client) -> start time
+        self.concurrent = {}     # mount index -> current listeners
+        self.buckets = {}        # (mount index, bucket start) -> Bucket
+        self.starts = array.array('d')
+        self.durations = array.array('f')
+        self.mount_ids = array.array('I')
+        self.next = 0            # next slot of the ring buffer
+        self.recorded = 0
+
+        if self.filename and os.path.exists(self.filename):
+            try:
+                self.load()
+            except Exception as exc:
+                logging.error(f"Error loading session store {self.filename}: {exc}")
+
+    def index(self, mount):
+        if mount not in self.mount_index:
+            self.mount_index[mount] = len(self.mounts)
+            self.mounts.append(mount)
+        return self.mount_index[mount]
+
+    def bucket(self, idx, t):
+        key = (idx, t - t % self.bucket_size)
+        if key not in self.buckets:
+            self.buckets[key] = Bucket(peak=self.concurrent.get(idx, 0))
+        return self.buckets[key]
+
+    def open_session(self, mount, client):
+        now = time.time()
+        with self.lock:
+            if (mount, client) in self.open:
+                return
+            self.open[(mount, client)] = now
+            idx = self.index(mount)
+            self.concurrent[idx] = self.concurrent.get(idx, 0) + 1
+            bucket = self.bucket(idx, now)
+            bucket.sessions += 1
+            bucket.peak = max(bucket.peak, self.concurrent[idx])
+
+    def close_session(self, mount, client):
+        now = time.time()
+        with self.lock:
+            start = self.open.pop((mount, client), None)
+            if start is None:
+                return
+            idx = self.index(mount)
+            self.concurrent[idx] -= 1
+            duration = now - start
+            bucket = self.buckets.get((idx, start - start % self.bucket_size))
+            if bucket is not None:
+                bucket.seconds += duration
+                bucket.histogram[histogram_bin(duration)] += 1
+
+            if len(self.starts) < self.capacity:
+                self.starts.append(start)
+                self.durations.append(duration)
+                self.mount_ids.append(idx)
+            else:
+                self.starts[self.next] = start
+                self.durations[self.next] = duration
+                self.mount_ids[self.next] = idx
+            self.next = (self.next + 1) % self.capacity
+            self.recorded += 1
+
+    def close_all(self):
+        '''Close all open sessions, e.g. on shutdown.'''
+        for mount, client in list(self.open):
+            self.close_session(mount, client)
+
+    def roll(self):
+        '''Open buckets for mounts with listeners and prune old buckets.'''
+        now = time.time()
+        oldest = now - now % self.bucket_size - self.retention * self.bucket_size
+        with self.lock:
+            for idx, listeners in self.concurrent.items():
+                if listeners:
+                    self.bucket(idx, now)
+            for key in [k for k in self.buckets if k[1] < oldest]:
+                del self.buckets[key]
+
+    def query(self, mount=None, buckets=24):
+        '''Per-bucket and overall statistics of the latest buckets of each mount.'''
+        now = time.time()
+        since = now - now % self.bucket_size - (buckets - 1) * self.bucket_size
+        result = {}
+        with self.lock:
+            for (idx, t), bucket in sorted(self.buckets.items(), key=lambda kv: kv[0][1]):
+                name = self.mounts[idx]
+                if t < since or (mount is not None and name != mount):
+                    continue
+                entry = result.setdefault(name, {
+                    'buckets': [], 'sessions': 0, 'peak': 0, 'seconds': 0.0,
+                    'histogram': [0] * (len(EDGES) + 1)})
+                entry['buckets'].append({
+                    'start': t,
+                    'sessions': bucket.sessions,
+                    'peak': bucket.peak,
+                    'median': percentile(bucket.histogram, 50),
+                })
+                entry['sessions'] += bucket.sessions
+                entry['peak'] = max(entry['peak'], bucket.peak)
+                entry['seconds'] += bucket.seconds
+                entry['histogram'] = [a + b for a, b in zip(entry['histogram'], bucket.histogram)]
+        for entry in result.values():
+            histogram = entry['histogram']
+            entry.update({q: percentile(histogram, p) for q, p in (('median', 50), ('p90', 90), ('p99', 99))})
+            entry['histogram'] = {f'<{edge}s' if i < len(EDGES) else f'>={EDGES[-1]}s': count
+                                  for i, (edge, count) in enumerate(zip(EDGES + (None,), histogram))}
+        return result
+
+    def status(self):
+        with self.lock:
+            return {
+                'open': len(self.open),
+                'recorded': self.recorded,
+                'stored': len(self.starts),
+                'capacity': self.capacity,
+                'buckets': len(self.buckets),
+            }
+
+    def save(self):
+        '''Write the store to session_file, replacing it atomically.'''
+        if not self.filename:
+            return
+        with self.lock:
+            meta = {
+                'bucket_size': self.bucket_size,
+                'mounts': self.mounts,
+                'next': self.next,
+                'recorded': self.recorded,
+                'count': len(self.starts),
+                'buckets': [[idx, t] + b.to_list() for (idx, t), b in self.buckets.items()],
+            }
+            data = self.starts.tobytes() + self.durations.tobytes() + self.mount_ids.tobytes()
+        tmpname = self.filename + '.tmp'
+        with open(tmpname, 'wb') as f:
+            f.write(MAGIC)
+            f.write(json.dumps(meta, separators=(',', ':')).encode('utf-8') + b'\n')
+            f.write(data)
+        os.replace(tmpname, self.filename)
+
+    def load(self):
+        with open(self.filename, 'rb') as f:
+            if f.readline() != MAGIC:
+                raise RuntimeError('not a session store')
+            meta = json.loads(f.readline())
+            data = f.read()
+        self.mounts = meta['mounts']
+        self.mount_index = {m: i for i, m in enumerate(self.mounts)}
+        if meta['bucket_size'] == self.bucket_size:
+            for idx, t, sessions, peak, seconds, histogram in meta['buckets']:
+                self.buckets[(idx, t)] = Bucket(sessions, peak, seconds, histogram)
+
+        count = meta['count']
+        sizes = [count * array.array(tc).itemsize for tc in 'dfI']
+        self.starts.frombytes(data[:sizes[0]])
+        self.durations.frombytes(data[sizes[0]:sizes[0] + sizes[1]])
+        self.mount_ids.frombytes(data[sizes[0] + sizes[1]:sum(sizes)])
+        # oldest first, keeping the latest sessions if the capacity shrank
+        order = (list(range(meta['next'], count)) + list(range(meta['next'])))[-self.capacity:]
+        self.starts = array.array('d', (self.starts[i] for i in order))
+        self.durations = array.array('f', (self.durations[i] for i in order))
+        self.mount_ids = array.array('I', (self.mount_ids[i] for i in order))
+        self.next = len(self.starts) % self.capacity
+        self.recorded = meta['recorded']
+        logging.info(f"Loaded {len(self.starts)} sessions from {self.filename}")
+
+    def run(self):
+        last_save = time.monotonic()
+        while not self.stopping.wait(min(self.save_interval, self.bucket_size / 4)):
+            self.roll()
+            if time.monotonic() - last_save >= self.save_interval:
+                last_save = time.monotonic()
+                try:
+                    self.save()
+                except Exception as exc:
+                    logging.error(f"Error saving session store {self.filename}: {exc}")
+
+    def stop(self):
+        self.stopping.set()
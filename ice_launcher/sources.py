@@ -4,16 +4,189 @@
 # Released under the MIT Licence
 
 import subprocess
+import threading
+import queue
 import time
 import logging
-from . import metadata
+import urllib.parse
+import urllib.request
+from . import metadata, watchdog
 
 class IceLaunchError(RuntimeError):
     """Exception for problems launching the process."""
     pass
 
-def start_source(mount, conf):
-    """Start source for mount given."""
+class InputHealth:
+    """Connection statistics of an input, used to rank the inputs of a mount."""
+    ALPHA = 0.3 # smoothing of the connect time
+
+    def __init__(self, url):
+        self.url = url
+        self.attempts = 0
+        self.failures = 0
+        self.connect_time = None
+
+    def success(self, connect_time):
+        self.attempts += 1
+        if self.connect_time is None:
+            self.connect_time = connect_time
+        else:
+            self.connect_time += self.ALPHA * (connect_time - self.connect_time)
+
+    def failure(self):
+        self.attempts += 1
+        self.failures += 1
+
+    def failure_rate(self):
+        return self.failures / self.attempts if self.attempts else 0.0
+
+    def score(self, weight):
+        return weight * (1.0 - self.failure_rate()) / (1.0 + (self.connect_time or 0.0))
+
+# health of each input url, and the input each running mount uses
+input_health = {}
+active_inputs = {}
+health_lock = threading.Lock()
+
+def get_health(url):
+    with health_lock:
+        if url not in input_health:
+            input_health[url] = InputHealth(url)
+        return input_health[url]
+
+def rank_inputs(mount, conf, exclude=()):
+    """Inputs of mount not in exclude, best health score first."""
+    inputs = [(url, weight) for url, weight in conf.mounts[mount]['inputs']
+              if url not in exclude]
+    inputs.sort(key=lambda inp: get_health(inp[0]).score(inp[1]), reverse=True)
+    return [url for url, _weight in inputs]
+
+# start of HLS playlists, the tag of variants in master playlists, and
+# the most playlists followed to reach a segment (a master playlist and
+# one of its variants)
+HLS_MAGIC = b'#EXTM3U'
+HLS_VARIANT = '#EXT-X-STREAM-INF'
+HLS_DEPTH = 2
+MAX_PLAYLIST = 1 << 20
+
+def read_first_data(url, conf):
+    """Wait for the first data of url.
+
+    For an HLS playlist, returns the url of an entry instead, as the
+    playlist being served says little about the stream: the first variant
+    of a master playlist, or the latest segment of a media playlist, as
+    older ones of a live window may have expired.
+    """
+    request = urllib.request.Request(url)
+    if conf.main['ffmpeg_agent']:
+        request.add_header('User-Agent', conf.main['ffmpeg_agent'])
+    with urllib.request.urlopen(
+            request, timeout=conf.main['input_probe_timeout']) as rsp:
+        data = rsp.read(len(HLS_MAGIC))
+        if not data:
+            raise IceLaunchError('no data received')
+        if data != HLS_MAGIC:
+            return None
+        playlist = rsp.read(MAX_PLAYLIST).decode('utf-8', errors='replace')
+        base = rsp.geturl()
+    lines = [line.strip() for line in playlist.splitlines()]
+    entries = [line for line in lines if line and not line.startswith('#')]
+    if not entries:
+        raise IceLaunchError('empty playlist')
+    master = any(line.startswith(HLS_VARIANT) for line in lines)
+    return urllib.parse.urljoin(base, entries[0] if master else entries[-1])
+
+def probe_input(url, conf):
+    """Open input and wait for the first data. Returns the time taken.
+
+    HLS playlists are followed to their latest segment.
+    """
+    start = time.monotonic()
+    if url.split('://', 1)[0].lower() in ('http', 'https'):
+        for _ in range(HLS_DEPTH + 1):
+            url = read_first_data(url, conf)
+            if url is None:
+                break
+        else:
+            raise IceLaunchError('playlists nested too deeply')
+    return time.monotonic() - start
+
+def race_inputs(mount, conf, candidates):
+    """Probe candidates in parallel, staggered by rank.
+
+    Returns the candidates with the first one delivering data in front.
+    """
+    results = queue.Queue()
+    done = threading.Event()
+    stagger = conf.main['input_probe_stagger']
+
+    def probe(rank, url):
+        if done.wait(rank * stagger):
+            return
+        try:
+            elapsed = probe_input(url, conf)
+        except Exception as exc:
+            logging.debug('probing input %d for mount "%s" failed: %r' % (rank, mount, exc))
+            get_health(url).failure()
+            results.put(None)
+        else:
+            get_health(url).success(elapsed)
+            results.put(url)
+
+    for rank, url in enumerate(candidates):
+        threading.Thread(target=probe, args=(rank, url), daemon=True).start()
+
+    deadline = time.monotonic() + conf.main['input_probe_timeout'] + stagger * len(candidates)
+    try:
+        for _ in candidates:
+            winner = results.get(timeout=max(deadline - time.monotonic(), 0.0))
+            if winner is not None:
+                logging.info('input %d won the startup race for mount "%s"' % (
+                    candidates.index(winner), mount))
+                return [winner] + [url for url in candidates if url != winner]
+    except queue.Empty:
+        pass
+    finally:
+        done.set()
+    logging.warning('no input for mount "%s" answered the probe' % mount)
+    return candidates
+
+def start_source(mount, conf, exclude=(), target=None):
+    """Start source for mount given, trying its inputs in turn.
+
+    The source is sent to icecast server target (default the main one).
+    """
+    if target is None:
+        target = conf.icecast['main']
+
+    candidates = rank_inputs(mount, conf, exclude)
+    if not candidates:
+        raise IceLaunchError('no inputs left')
+    if len(candidates) > 1 and conf.main['input_probe']:
+        candidates = race_inputs(mount, conf, candidates)
+
+    for url in candidates:
+        try:
+            popen = launch_ffmpeg(mount, conf, url, target)
+        except IceLaunchError:
+            get_health(url).failure()
+            continue
+        active_inputs[mount] = url
+        metadata.add_updater(mount, conf, stream=url, target=target)
+        watchdog.add_watchdog(mount, popen, conf)
+        return popen
+
+    raise IceLaunchError('ffmpeg process failed to start')
+
+def input_failed(mount):
+    """Record an upstream failure of the input mount is using."""
+    url = active_inputs.get(mount)
+    if url is not None:
+        get_health(url).failure()
+    return url
+
+def launch_ffmpeg(mount, conf, url, target):
+    """Start ffmpeg for mount reading from input url, sending to icecast server target."""
 
     # conf options for mount
     mount_conf = conf.mounts[mount]
@@ -21,7 +194,7 @@ def start_source(mount, conf):
     cmd = [
         'ffmpeg',
         '-re',   # realtime
-        '-i', mount_conf['input'], # input url (or file)
+        '-i', url, # input url (or file)
         '-vn',   # no video
     ]
 
@@ -51,17 +224,23 @@ def start_source(mount, conf):
     if not conf.main['ffmpeg_verbose']:
         cmd += ['-loglevel', 'error', '-hide_banner']
 
-    if conf.main['legacy_icecast']:
+    # progress output for the stall watchdog
+    stdout = None
+    if watchdog.enabled(conf):
+        cmd += ['-progress', 'pipe:1', '-nostats']
+        stdout = subprocess.PIPE
+
+    if target['legacy']:
         cmd += ['-legacy_icecast', '1']
     if conf.main['ffmpeg_agent']:
         cmd += ['-user_agent', conf.main['ffmpeg_agent']]
 
     # output connection
     cmd.append('icecast://%s:%s@%s:%d/%s' % (
-        conf.main['icecast_user'],
-        conf.main['icecast_password'],
-        conf.main['icecast_host'],
-        conf.main['icecast_port'],
+        target['user'],
+        target['password'],
+        target['host'],
+        target['port'],
         mount,
     ))
     logging.info(" starting ffmpeg command for mount %s (%s)" % (
@@ -69,7 +248,7 @@ def start_source(mount, conf):
 
     # start ffmpeg process
     try:
-        popen = subprocess.Popen(cmd)
+        popen = subprocess.Popen(cmd, stdout=stdout)
     except Exception as exc:
         logging.error('ffmpeg process for mount "%s" did not start: %r' % (mount, exc))
         raise IceLaunchError('ffmpeg process failed to start')
@@ -83,17 +262,47 @@ def start_source(mount, conf):
             'ffmpeg process for mount "%s" died after starting' % mount)
         raise IceLaunchError('ffmpeg process failed to start')
 
-    metadata.add_updater(mount, conf)
-
     return popen
 
 def stop_source(popen, mount, conf):
     """Stop source for mount given."""
     metadata.remove_updater(mount, conf)
-    popen.terminate()
-    popen.wait()
+    watchdog.remove_watchdog(mount)
+    active_inputs.pop(mount, None)
+    if terminate_process(popen, conf.main['ffmpeg_stop_timeout']):
+        logging.warning('ffmpeg for mount "%s" had to be killed' % mount)
     logging.info('successfully stopped ffmpeg for mount "%s"' % mount)
 
+def terminate_process(popen, timeout):
+    """Terminate process, killing it if it has not exited after timeout.
+
+    Returns whether it had to be killed.
+    """
+    popen.terminate()
+    try:
+        popen.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        popen.kill()
+        popen.wait()
+        return True
+    return False
+
+def status():
+    """Active input of each mount and health of all inputs seen."""
+    from .api import mask
+    with health_lock:
+        health = list(input_health.values())
+    return {
+        "active": {m: mask(url) for m, url in active_inputs.items()},
+        "health": {
+            mask(h.url): {
+                "attempts": h.attempts,
+                "failures": h.failures,
+                "connect_time": h.connect_time,
+            } for h in health
+        },
+    }
+
 def get_options_mode_copy_aac(mount, conf): # NOSONAR(S1172)
     """Specific options for copy_aac mode."""
     return (
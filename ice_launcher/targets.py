@@ -0,0 +1,163 @@
+# icelaunch: Place sources on a pool of icecast servers
+#
+# Copyright Jeremy Sanders (2023)
+# Released under the MIT Licence
+
+import threading
+import time
+import logging
+
+from . import api
+
+def to_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+class TargetPool:
+    '''Icecast servers sources are sent to.
+
+    Each callback is linked to the server that sent it, by the URL path
+    it was posted to (e.g. http://127.0.0.1:9854/relay1 for [icecast.relay1])
+    or by its server and port parameters. New sources go to the least
+    loaded server of the caller's group; servers in the same group (e.g. a
+    master and its relays) are interchangeable. Callbacks from unknown
+    servers count as coming from the main server. There is one source per mount, so
+    listeners from another group than the running source's are refused.
+    '''
+
+    def __init__(self, conf):
+        self.conf = conf
+        self.targets = conf.icecast
+        self.interval = conf.main['icecast_stats_interval']
+        self.timeout = conf.main['icecast_stats_timeout']
+        self.lock = threading.Lock()
+        self.placement = {} # mount -> target name
+        self.placed_at = {} # mount -> time it was placed
+        self.source_kbitrate = conf.main['icecast_source_kbitrate']
+        self.stats = {}     # target name -> (time, stats or None, error)
+
+    def identify(self, path, params):
+        '''Name of the icecast server sending a callback, or None.'''
+        name = urlpath_name(path)
+        if name in self.targets:
+            return name
+        server, port = params.get('server'), params.get('port')
+        for name, target in self.targets.items():
+            if target['host'] == server and str(target['port']) == port:
+                return name
+        return None
+
+    def fetch(self, name, max_age):
+        '''Parsed stats of server name, cached for max_age seconds.'''
+        with self.lock:
+            cached = self.stats.get(name)
+        if cached is not None and time.monotonic() - cached[0] < max_age:
+            return cached
+        try:
+            stats, error = api.icecast_status(self.conf, self.targets[name], timeout=self.timeout), None
+        except Exception as exc:
+            logging.warning(f"Error reading stats of icecast server {name}: {exc}")
+            stats, error = None, str(exc)
+        cached = (time.monotonic(), stats, error)
+        with self.lock:
+            self.stats[name] = cached
+        return cached
+
+    def load(self, name):
+        '''Sort key of server name by load, unreachable servers last.
+
+        Sources placed since the stats were read are not in them yet, so
+        each counts as one listener at source_kbitrate.
+        '''
+        fetched, stats, _error = self.fetch(name, self.interval)
+        with self.lock:
+            mounts = [m for m, target in self.placement.items() if target == name]
+            recent = sum(1 for m in mounts if self.placed_at[m] >= fetched)
+        if stats is None:
+            return (1, 0.0, 0.0, len(mounts))
+        return (0, to_number(stats.get('outgoing_kbitrate')) + recent * self.source_kbitrate,
+                to_number(stats.get('listeners')) + recent, len(mounts))
+
+    def place(self, mount, caller=None):
+        '''Server for the source of mount, choosing one if not yet placed.'''
+        with self.lock:
+            if mount in self.placement:
+                return self.targets[self.placement[mount]]
+        group = self.group(caller)
+        candidates = [n for n, t in self.targets.items() if t['group'] == group]
+        name = candidates[0]
+        if len(candidates) > 1:
+            name = min(candidates, key=self.load)
+        logging.info(f"placing source for mount {mount} on icecast server {name}")
+        with self.lock:
+            self.placement[mount] = name
+            self.placed_at[mount] = time.monotonic()
+        return self.targets[name]
+
+    def group(self, caller):
+        '''Group of server caller, that of the main server if unknown.'''
+        return self.targets[caller if caller is not None else 'main']['group']
+
+    def serves(self, mount, caller):
+        '''Whether listeners of server caller can hear the source of mount.'''
+        with self.lock:
+            name = self.placement.get(mount)
+        return name is None or self.targets[name]['group'] == self.group(caller)
+
+    def target(self, mount):
+        '''Server the source of mount was placed on.'''
+        with self.lock:
+            return self.targets[self.placement.get(mount, 'main')]
+
+    def release(self, mount):
+        with self.lock:
+            self.placement.pop(mount, None)
+            self.placed_at.pop(mount, None)
+
+    def status(self):
+        '''Summary of each server, totals over the reachable ones and
+        the full stats of the main server (None if not reachable), at
+        most icecast_stats_interval old.'''
+        per_target = {}
+        total = None
+        main = None
+        # cached for the stats interval and refreshed in parallel, as the
+        # HTTP server handles no callbacks meanwhile
+        fetched = {}
+
+        def fetch(name):
+            fetched[name] = self.fetch(name, self.interval)
+
+        threads = [threading.Thread(target=fetch, args=(name,), daemon=True) for name in self.targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for name, target in self.targets.items():
+            _time, stats, error = fetched[name]
+            with self.lock:
+                mounts = sorted(m for m, t in self.placement.items() if t == name)
+            per_target[name] = {
+                "host": target['host'],
+                "port": target['port'],
+                "group": target['group'],
+                "mounts": mounts,
+                "listeners": int(to_number(stats.get('listeners'))) if stats else None,
+                "outgoing_kbitrate": int(to_number(stats.get('outgoing_kbitrate'))) if stats else None,
+                "error": error,
+            }
+            if stats is None:
+                continue
+            if name == 'main':
+                main = stats
+            if total is None:
+                total = {"listeners": 0, "outgoing_kbitrate": 0, "source": {}}
+            total["listeners"] += per_target[name]["listeners"]
+            total["outgoing_kbitrate"] += per_target[name]["outgoing_kbitrate"]
+            total["source"].update(stats.get("source", {}))
+        return per_target, total, main
+
+def urlpath_name(path):
+    return (path or '').split('?', 1)[0].strip('/')
@@ -0,0 +1,141 @@
+# icelaunch: Restart stalled sources
+#
+# Copyright Jeremy Sanders (2023)
+# Released under the MIT Licence
+
+import threading
+import time
+import logging
+
+def parse_number(value, suffix=''):
+    '''Convert ffmpeg progress value to float, None if not available.'''
+    if value is None:
+        return None
+    value = value.strip()
+    if suffix and value.endswith(suffix):
+        value = value[:-len(suffix)]
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+class Watchdog(threading.Thread):
+    '''Follow the progress output of a source's ffmpeg.
+
+    The process is terminated if its output time does not advance, or its
+    speed stays below the minimum, for the stall window, and killed if it
+    does not exit within ffmpeg_stop_timeout. Restarting it is
+    left to the server, which watches for processes exiting by themselves.
+    '''
+
+    def __init__(self, mount, popen, conf):
+        super().__init__(daemon=True, name='watchdog-%s' % mount)
+        self.mount = mount
+        self.popen = popen
+        self.window = conf.main['stall_window']
+        self.min_speed = conf.main['stall_min_speed']
+        self.stop_timeout = conf.main['ffmpeg_stop_timeout']
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+
+        self.out_time = None    # seconds of audio written
+        self.bitrate = None     # kbit/s
+        self.speed = None       # relative to realtime
+        self.total_size = None  # bytes written
+        self.advanced = time.monotonic()
+        self.slow_since = None
+
+    def read_progress(self):
+        '''Read progress blocks (key=value lines ending with progress=...).'''
+        block = {}
+        for line in self.popen.stdout:
+            key, _, value = line.decode('utf-8', errors='replace').strip().partition('=')
+            block[key] = value
+            if key == 'progress':
+                self.update(block)
+                block = {}
+
+    def update(self, block):
+        now = time.monotonic()
+        out_time = parse_number(block.get('out_time_us'))
+        if out_time is None:
+            # before ffmpeg 4.2, also in microseconds despite the name
+            out_time = parse_number(block.get('out_time_ms'))
+        speed = parse_number(block.get('speed'), 'x')
+        with self.lock:
+            if out_time is not None:
+                out_time /= 1e6
+                if self.out_time is None or out_time > self.out_time:
+                    self.advanced = now
+                self.out_time = out_time
+            if speed is not None and speed < self.min_speed:
+                if self.slow_since is None:
+                    self.slow_since = now
+            else:
+                self.slow_since = None
+            self.speed = speed
+            self.bitrate = parse_number(block.get('bitrate'), 'kbits/s')
+            total_size = parse_number(block.get('total_size'))
+            self.total_size = int(total_size) if total_size is not None else None
+
+    def stalled(self, now):
+        '''Reason why the source is stalled, or None.'''
+        with self.lock:
+            if now - self.advanced >= self.window:
+                return 'no output for %.0f seconds' % (now - self.advanced)
+            if self.slow_since is not None and now - self.slow_since >= self.window:
+                return 'speed %sx below %sx for %.0f seconds' % (
+                    self.speed, self.min_speed, now - self.slow_since)
+        return None
+
+    def run(self):
+        from .sources import terminate_process
+        threading.Thread(target=self.read_progress, daemon=True).start()
+        while not self.stopping.wait(min(1.0, self.window / 4)):
+            reason = self.stalled(time.monotonic())
+            if reason is None or self.popen.poll() is not None:
+                continue
+            stall_counts[self.mount] = stall_counts.get(self.mount, 0) + 1
+            logging.warning('source for mount "%s" stalled (%s), restarting' % (
+                self.mount, reason))
+            if terminate_process(self.popen, self.stop_timeout):
+                logging.warning('killed stalled source for mount "%s"' % self.mount)
+            break
+
+    def stop(self):
+        self.stopping.set()
+
+watchdogs = {}
+stall_counts = {}
+
+def enabled(conf):
+    return conf.main['stall_window'] > 0
+
+def add_watchdog(mount, popen, conf):
+    '''Start watching the ffmpeg process for mount.'''
+    if not enabled(conf):
+        return
+    remove_watchdog(mount)
+    watchdogs[mount] = Watchdog(mount, popen, conf)
+    watchdogs[mount].start()
+
+def remove_watchdog(mount):
+    watchdog = watchdogs.pop(mount, None)
+    if watchdog is not None:
+        watchdog.stop()
+
+def status():
+    '''Throughput and stall counts of each mount.'''
+    status_dict = {}
+    for mount, watchdog in list(watchdogs.items()):
+        with watchdog.lock:
+            status_dict[mount] = {
+                'out_time': watchdog.out_time,
+                'bitrate': watchdog.bitrate,
+                'speed': watchdog.speed,
+                'total_size': watchdog.total_size,
+                'stalls': stall_counts.get(mount, 0),
+            }
+    for mount, stalls in stall_counts.items():
+        status_dict.setdefault(mount, {'stalls': stalls})
+    return status_dict
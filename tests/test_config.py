@@ -0,0 +1,41 @@
+import os, tempfile, unittest
+
+from ice_launcher import config
+
+class TestConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, 'ice_launcher.conf')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read(self, mount_options=''):
+        with open(self.filename, 'w') as f:
+            f.write('[main]\n\n[mount.radio]\ninput=http://example.com/radio\n' + mount_options)
+        return config.Config(self.filename)
+
+    def test_meta_defaults(self):
+        conf = self.read()
+        self.assertEqual(conf.mounts['radio']['meta_idle_after'], 6)
+        self.assertIsNone(conf.mounts['radio']['meta_max_retry'])
+
+    def test_meta_idle_after_at_least_one(self):
+        self.assertEqual(self.read('meta_idle_after=1\n').mounts['radio']['meta_idle_after'], 1)
+        with self.assertRaises(RuntimeError):
+            self.read('meta_idle_after=0\n')
+    def test_parse_inputs(self):
+        inputs = config.parse_inputs(
+            'http://a/stream weight=2\n\n  http://b/stream?weight=3  \nhttp://c/stream\tweight=0.5\n')
+        self.assertEqual(inputs, [('http://a/stream', 2.0), ('http://b/stream?weight=3', 1.0),
+                                  ('http://c/stream', 0.5)])
+        self.assertEqual(self.read().mounts['radio']['inputs'], [('http://example.com/radio', 1.0)])
+
+    def test_parse_invalid_weights(self):
+        for weight in ('weight=', 'weight=high', 'weight=0', 'weight=-1', 'weight=nan'):
+            with self.assertRaises(RuntimeError, msg=weight):
+                config.parse_inputs('http://a/stream ' + weight)
+
+if __name__ == '__main__':
+    unittest.main()
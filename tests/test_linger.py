@@ -0,0 +1,80 @@
+import unittest
+from unittest import mock
+
+from ice_launcher import linger
+
+class Conf:
+    def __init__(self, linger_time=60.0, max_warm=None, policy='lru'):
+        self.main = {
+            'linger_time': linger_time,
+            'source_remove_delay': 0,
+            'linger_max_warm': max_warm,
+            'linger_policy': policy,
+        }
+
+class TestLingerPool(unittest.TestCase):
+
+    def pool(self, *args, **kwargs):
+        self.expired = []
+        pool = linger.LingerPool(Conf(*args, **kwargs), self.expired.append)
+        self.addCleanup(pool.clear)
+        return pool
+
+    def test_unknown_policy(self):
+        with self.assertRaises(RuntimeError):
+            self.pool(policy='random')
+
+    def test_no_linger_time_expires_at_once(self):
+        pool = self.pool(linger_time=0.0)
+        self.assertEqual(pool.park('a'), ['a'])
+        self.assertTrue(pool.release('a'))
+        self.assertFalse(pool.release('a'))
+
+    def test_default_linger_time(self):
+        conf = Conf(linger_time=None)
+        conf.main['source_remove_delay'] = 30
+        self.assertEqual(linger.LingerPool(conf, None).linger_time, 30)
+
+    def test_lru_over_budget(self):
+        pool = self.pool(max_warm=2)
+        self.assertEqual(pool.park('a'), [])
+        self.assertEqual(pool.park('b'), [])
+        self.assertTrue(pool.resume('a'))
+        self.assertEqual(pool.park('a'), [])
+        self.assertEqual(pool.park('c'), ['b'])
+
+    def test_probability_over_budget(self):
+        pool = self.pool(max_warm=2, policy='probability')
+        # a came back quickly, b only after the linger time
+        with mock.patch.object(linger.time, 'monotonic', side_effect=[0.0, 0.0, 10.0, 1000.0]):
+            pool.park('a')
+            pool.park('b')
+            pool.resume('a')
+            pool.resume('b')
+        self.assertGreater(pool.return_probability('a'), pool.return_probability('b'))
+        pool.park('b')
+        pool.park('a')
+        self.assertEqual(pool.park('c'), ['b'])
+
+    def test_hits_and_cold_starts(self):
+        pool = self.pool()
+        pool.started('a', True) # first listener, not returning
+        pool.park('a')
+        self.assertTrue(pool.resume('a'))
+        pool.started('a', True)
+        pool.park('a')
+        pool.resume('a')
+        pool.started('a', False)
+        status = pool.status()
+        self.assertEqual((status['hits'], status['cold_starts']), (1, 1))
+        self.assertEqual(status['mounts']['a']['hits'], 1)
+        self.assertEqual(status['idle'], {})
+
+    def test_timer_expires(self):
+        pool = self.pool(linger_time=0.01)
+        pool.park('a')
+        pool.idle['a'].join(1.0)
+        self.assertEqual(self.expired, ['a'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+from unittest import mock
+
+from ice_launcher import metadata
+from ice_launcher.metadata import streammeta
+
+class Conf:
+    def __init__(self):
+        self.main = {}
+        self.icecast = {'main': {'host': '127.0.0.1', 'port': 8000,
+                                 'admin': 'admin', 'admin_password': 'pw'}}
+        self.mounts = {'radio': {
+            'inputs': [('http://example.com/radio', 1.0)],
+            'meta_min_interval': 5.0,
+            'meta_max_interval': 60.0,
+            'meta_idle_interval': 300.0,
+            'meta_idle_after': 3,
+            'meta_max_retry': None,
+        }}
+
+class TestUpdater(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(metadata.time, 'monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.updater = metadata.Updater('radio', Conf())
+
+    def poll(self, result=None, error=None):
+        with mock.patch.object(metadata.streammeta, 'get_meta', return_value=result, side_effect=error), \
+                mock.patch.object(metadata.requests, 'get'), mock.patch.object(metadata.logging, 'error'):
+            self.updater.update()
+
+    def test_default_max_retry(self):
+        self.assertEqual(self.updater.max_retry, streammeta.MAX_RETRY)
+
+    def test_default_before_title_change(self):
+        self.assertEqual(self.updater.next_interval(), metadata.Updater.DEFAULT_INTERVAL)
+        self.poll({'StreamTitle': 'first'})
+        self.assertEqual(self.updater.next_interval(), metadata.Updater.DEFAULT_INTERVAL)
+
+    def learn(self, duration=200.0):
+        for title in ('a', 'b', 'c'):
+            self.poll({'StreamTitle': title})
+            self.now += duration
+
+    def test_interval_shrinks_as_change_comes_due(self):
+        self.learn()
+        self.poll({'StreamTitle': 'd'})
+        self.assertEqual(self.updater.next_interval(), 60.0)
+        self.now += 150.0
+        self.assertEqual(self.updater.next_interval(), 25.0)
+        self.now += 45.0
+        self.assertEqual(self.updater.next_interval(), 5.0)
+
+    def test_backs_off_once_overdue(self):
+        self.learn()
+        self.poll({'StreamTitle': 'd'})
+        self.now += 210.0
+        self.assertEqual(self.updater.next_interval(), 10.0)
+        self.now += 100.0
+        self.assertEqual(self.updater.next_interval(), 60.0)
+
+    def test_idle_after_empty_polls(self):
+        for _ in range(2):
+            self.poll(None)
+        self.assertEqual(self.updater.next_interval(), metadata.Updater.DEFAULT_INTERVAL)
+        self.poll({'icy-name': 'no title'})
+        self.assertEqual(self.updater.next_interval(), 300.0)
+        self.poll({'StreamTitle': 'back'})
+        self.assertEqual(self.updater.next_interval(), metadata.Updater.DEFAULT_INTERVAL)
+
+    def test_idle_after_errors(self):
+        for _ in range(3):
+            self.poll(error=OSError('unreachable'))
+        self.assertEqual(self.updater.next_interval(), 300.0)
+
+    def test_max_interval_after_exhausted_skips(self):
+        self.poll(error=streammeta.MetaError('adverts'))
+        self.assertEqual(self.updater.next_interval(), 60.0)
+        self.assertEqual(self.updater.skip_exhausted, 1)
+        self.poll({'StreamTitle': 'song'})
+        self.assertEqual(self.updater.next_interval(), metadata.Updater.DEFAULT_INTERVAL)
+
+if __name__ == '__main__':
+    unittest.main()
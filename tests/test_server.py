@@ -0,0 +1,67 @@
+import os, sys, json, time, signal, socket, subprocess, tempfile, unittest, urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIG = """
+[main]
+listen_port={port}
+icecast_port={icecast_port}
+icecast_stats_timeout=0.5
+session_file={session_file}
+
+[mount.test]
+input=http://127.0.0.1:{icecast_port}/input
+"""
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+class TestRunServer(unittest.TestCase):
+    """Smoke test: the launcher starts, serves its status and shuts down."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.port = free_port()
+        self.session_file = os.path.join(self.tmpdir.name, 'sessions.bin')
+        conffile = os.path.join(self.tmpdir.name, 'test.conf')
+        with open(conffile, 'w') as f:
+            f.write(CONFIG.format(port=self.port, icecast_port=free_port(),
+                                  session_file=self.session_file))
+        self.proc = subprocess.Popen(
+            [sys.executable, '-c', 'from ice_launcher.main import main; main()',
+             '--config', conffile],
+            cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def tearDown(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+            self.proc.wait()
+        self.proc.stderr.close()
+        self.tmpdir.cleanup()
+
+    def get(self, path):
+        url = f'http://127.0.0.1:{self.port}{path}'
+        deadline = time.monotonic() + 10.0
+        while True:
+            try:
+                with urllib.request.urlopen(url, timeout=5.0) as rsp:
+                    return json.loads(rsp.read())
+            except OSError:
+                if time.monotonic() > deadline or self.proc.poll() is not None:
+                    raise
+                time.sleep(0.1)
+
+    def test_start_status_stop(self):
+        status = self.get('/api/status.json')
+        self.assertEqual(status['processes'], {})
+        self.assertIsNotNone(status['targets']['main']['error'])
+        self.assertEqual(self.get('/api/sessions.json'), {})
+
+        self.proc.send_signal(signal.SIGTERM)
+        self.assertEqual(self.proc.wait(timeout=10.0), 0, self.proc.stderr.read())
+        self.assertTrue(os.path.exists(self.session_file))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import os, tempfile, unittest
+
+from ice_launcher import sessions
+
+class Conf:
+    def __init__(self, filename, capacity=5):
+        self.main = {
+            'session_file': filename,
+            'session_capacity': capacity,
+            'session_bucket': 3600,
+            'session_retention': 720,
+            'session_save_interval': 300.0,
+        }
+
+class TestSessionStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, 'sessions.bin')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def record(self, store, mount, count, length=40.0):
+        for i in range(count):
+            store.open_session(mount, str(i))
+            store.open[(mount, str(i))] -= (i + 1) * length
+        for i in range(count):
+            store.close_session(mount, str(i))
+
+    def test_query(self):
+        store = sessions.SessionStore(Conf(None))
+        self.record(store, 'a', 8)
+        result = store.query('a')['a']
+        self.assertEqual(result['sessions'], 8)
+        self.assertEqual(result['peak'], 8)
+        self.assertTrue(120 <= result['median'] <= 300)
+        self.assertEqual(store.status()['stored'], 5)
+
+    def test_save_load(self):
+        store = sessions.SessionStore(Conf(self.filename))
+        self.record(store, 'a', 8)
+        store.save()
+
+        loaded = sessions.SessionStore(Conf(self.filename))
+        self.assertEqual(loaded.status()['recorded'], 8)
+        self.assertEqual(loaded.query(), store.query())
+        # oldest first after loading a wrapped ring buffer
+        self.assertEqual(list(loaded.durations), sorted(store.durations))
+
+        shrunk = sessions.SessionStore(Conf(self.filename, capacity=3))
+        self.assertEqual(list(shrunk.durations), sorted(store.durations)[-3:])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import threading, unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from ice_launcher import sources
+
+PLAYLISTS = {
+    '/master.m3u8': b'#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=128000\nhi/media.m3u8\n'
+                    b'#EXT-X-STREAM-INF:BANDWIDTH=64000\nlo/media.m3u8\n',
+    '/hi/media.m3u8': b'#EXTM3U\n#EXT-X-MEDIA-SEQUENCE:7\n#EXTINF:10,\nseg7.aac\n#EXTINF:10,\nseg8.aac\n',
+    '/hi/seg8.aac': b'\xff\xf1audio',
+    '/nested.m3u8': b'#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=1\nnested.m3u8\n',
+    '/empty.m3u8': b'#EXTM3U\n#EXT-X-ENDLIST\n',
+    '/nodata': b'',
+}
+
+class PlaylistHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = PLAYLISTS.get(self.path)
+        self.send_response(404 if body is None else 200)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args): # NOSONAR(S1172) silence the access log
+        pass
+
+class Conf:
+    def __init__(self, inputs=()):
+        self.main = {'ffmpeg_agent': None, 'input_probe_timeout': 2.0}
+        self.mounts = {'radio': {'inputs': list(inputs)}}
+
+class TestRankInputs(unittest.TestCase):
+
+    def setUp(self):
+        sources.input_health.clear()
+        self.addCleanup(sources.input_health.clear)
+
+    def test_rank_by_health(self):
+        conf = Conf([('http://a', 1.0), ('http://b', 1.0), ('http://c', 2.0)])
+        self.assertEqual(sources.rank_inputs('radio', conf), ['http://c', 'http://a', 'http://b'])
+        sources.get_health('http://c').failure()
+        sources.get_health('http://a').success(2.0)
+        sources.get_health('http://b').success(0.1)
+        self.assertEqual(sources.rank_inputs('radio', conf), ['http://b', 'http://a', 'http://c'])
+        self.assertEqual(sources.rank_inputs('radio', conf, exclude={'http://b'}), ['http://a', 'http://c'])
+
+    def test_failure_rate(self):
+        health = sources.get_health('http://a')
+        health.success(1.0)
+        health.failure()
+        self.assertEqual((health.attempts, health.failures, health.failure_rate()), (2, 1, 0.5))
+
+class TestProbe(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.httpd = HTTPServer(('127.0.0.1', 0), PlaylistHandler)
+        threading.Thread(target=cls.httpd.serve_forever, daemon=True).start()
+        cls.base = 'http://127.0.0.1:%d' % cls.httpd.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.shutdown()
+        cls.httpd.server_close()
+
+    def test_master_playlist_first_variant(self):
+        self.assertEqual(sources.read_first_data(self.base + '/master.m3u8', Conf()),
+                         self.base + '/hi/media.m3u8')
+
+    def test_media_playlist_latest_segment(self):
+        self.assertEqual(sources.read_first_data(self.base + '/hi/media.m3u8', Conf()),
+                         self.base + '/hi/seg8.aac')
+        self.assertIsNone(sources.read_first_data(self.base + '/hi/seg8.aac', Conf()))
+
+    def test_probe_follows_playlists(self):
+        self.assertGreaterEqual(sources.probe_input(self.base + '/master.m3u8', Conf()), 0.0)
+        # only http inputs are probed
+        self.assertLess(sources.probe_input('file:///dev/null', Conf()), 1.0)
+
+    def test_probe_failures(self):
+        for path in ('/nested.m3u8', '/empty.m3u8', '/nodata'):
+            with self.assertRaises(sources.IceLaunchError, msg=path):
+                sources.probe_input(self.base + path, Conf())
+        with self.assertRaises(OSError):
+            sources.probe_input(self.base + '/missing', Conf())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+from unittest import mock
+
+from ice_launcher import targets
+
+def target(name, group='pool'):
+    return {'name': name, 'host': '127.0.0.1', 'port': 8000, 'group': group,
+            'user': 'source', 'password': 'pw', 'admin': 'admin',
+            'admin_password': 'pw', 'legacy': False}
+
+class Conf:
+    def __init__(self, *names):
+        self.icecast = {name: target(name) for name in names}
+        self.main = {
+            'icecast_stats_interval': 10.0,
+            'icecast_stats_timeout': 1.0,
+            'icecast_source_kbitrate': 128.0,
+        }
+
+class TestTargetPool(unittest.TestCase):
+
+    def test_burst_spreads_over_servers(self):
+        pool = targets.TargetPool(Conf('main', 'relay1', 'relay2'))
+        stats = {'listeners': '0', 'outgoing_kbitrate': '0'}
+        with mock.patch.object(targets.api, 'icecast_status', return_value=stats):
+            placed = [pool.place('mount%d' % i)['name'] for i in range(6)]
+        self.assertEqual(sorted(placed), ['main', 'main', 'relay1', 'relay1', 'relay2', 'relay2'])
+
+    def test_least_loaded(self):
+        pool = targets.TargetPool(Conf('main', 'relay1'))
+        def status(_conf, target, timeout=None):
+            busy = target['name'] == 'main'
+            return {'listeners': '50' if busy else '1', 'outgoing_kbitrate': '6400' if busy else '128'}
+        with mock.patch.object(targets.api, 'icecast_status', side_effect=status):
+            self.assertEqual(pool.place('a')['name'], 'relay1')
+
+    def test_serves_group_only(self):
+        conf = Conf('main', 'relay1', 'other')
+        conf.icecast['other']['group'] = 'other'
+        pool = targets.TargetPool(conf)
+        pool.place('a', 'other')
+        self.assertTrue(pool.serves('a', 'other'))
+        self.assertFalse(pool.serves('a', None))
+        self.assertFalse(pool.serves('a', 'main'))
+        self.assertTrue(pool.serves('b', 'main'))
+
+    def test_unknown_caller_uses_main_group(self):
+        conf = Conf('main', 'relay1', 'other')
+        conf.icecast['other']['group'] = 'other'
+        pool = targets.TargetPool(conf)
+        stats = {'listeners': '0', 'outgoing_kbitrate': '0'}
+        with mock.patch.object(targets.api, 'icecast_status', return_value=stats):
+            placed = {pool.place('mount%d' % i)['name'] for i in range(4)}
+        self.assertEqual(placed, {'main', 'relay1'})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import io, unittest
+from unittest import mock
+
+from ice_launcher import watchdog
+
+class Conf:
+    def __init__(self):
+        self.main = {
+            'stall_window': 20.0,
+            'stall_min_speed': 0.5,
+            'ffmpeg_stop_timeout': 5.0,
+        }
+
+class Popen:
+    def __init__(self, output=b''):
+        self.stdout = io.BytesIO(output)
+
+def progress(out_time_us='N/A', speed='N/A', key='out_time_us'):
+    return {key: out_time_us, 'speed': speed, 'bitrate': '128.0kbits/s',
+            'total_size': '1000', 'progress': 'continue'}
+
+class TestWatchdog(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(watchdog.time, 'monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.dog = watchdog.Watchdog('mount', Popen(), Conf())
+
+    def feed(self, seconds, *blocks):
+        for block in blocks:
+            self.now += seconds
+            self.dog.update(block)
+
+    def test_advancing_output(self):
+        self.feed(10.0, *(progress(str(i * 10000000), '1.0x') for i in range(1, 6)))
+        self.assertIsNone(self.dog.stalled(self.now))
+        self.assertEqual(self.dog.out_time, 50.0)
+        self.assertEqual(self.dog.speed, 1.0)
+        self.assertEqual(self.dog.bitrate, 128.0)
+
+    def test_output_stops_advancing(self):
+        self.feed(10.0, progress('10000000', '1.0x'))
+        self.feed(10.0, progress('10000000', '1.0x'))
+        self.assertIsNone(self.dog.stalled(self.now))
+        self.feed(10.0, progress('10000000', '1.0x'))
+        self.assertIn('no output', self.dog.stalled(self.now))
+
+    def test_slow_speed(self):
+        self.feed(10.0, *(progress(str(i * 1000000), '0.1x') for i in range(1, 3)))
+        self.assertIsNone(self.dog.stalled(self.now))
+        self.feed(10.0, progress('3000000', '0.1x'))
+        self.assertIn('speed', self.dog.stalled(self.now))
+        self.feed(1.0, progress('13000000', '1.0x'))
+        self.assertIsNone(self.dog.stalled(self.now))
+
+    def test_not_available_values(self):
+        self.feed(10.0, progress())
+        self.assertIsNone(self.dog.out_time)
+        self.assertIsNone(self.dog.speed)
+        self.assertIsNone(self.dog.stalled(self.now))
+        self.feed(15.0, progress())
+        self.assertIn('no output', self.dog.stalled(self.now))
+
+    def test_old_ffmpeg_out_time_ms(self):
+        self.feed(15.0, *(progress(str(i * 15000000), '1.0x', key='out_time_ms') for i in range(1, 4)))
+        self.assertEqual(self.dog.out_time, 45.0)
+        self.assertIsNone(self.dog.stalled(self.now))
+
+    def test_read_progress(self):
+        output = b'out_time_us=N/A\nspeed=N/A\nprogress=continue\nout_time_us=2000000\nspeed=1.01x\nprogress=end\n'
+        self.dog.popen = Popen(output)
+        self.dog.read_progress()
+        self.assertEqual(self.dog.out_time, 2.0)
+        self.assertEqual(self.dog.speed, 1.01)
+
+if __name__ == '__main__':
+    unittest.main()